@@ -0,0 +1,152 @@
+"""
+Product catalog with canonical-name resolution.
+
+`Catalog` is built once from the `paper_supplies` records and keeps a hash index from a
+normalized form of every item name (and of every registered alias) to its record. Normalizing
+folds case, punctuation, spacing and plurals, so "a4 papers", "Letter sized paper" and
+"card stock" all resolve in one dictionary lookup to the catalog item they mean.
+
+The 'inventory' and 'transactions' tables store item names lower-cased, so tools use
+`Catalog.canonical_name` to turn whatever name they were given into that key.
+"""
+import difflib
+import re
+from typing import Dict, Iterable, List, Optional
+
+# Names customers use for catalog items, mapped to the catalog name
+DEFAULT_ALIASES = {
+    "copy paper": "Standard copy paper",
+    "printer paper": "Standard copy paper",
+    "printing paper": "Standard copy paper",
+    "letter paper": "Letter-sized paper",
+    "legal paper": "Legal-size paper",
+    "washi tape": "Decorative adhesive tape (washi tape)",
+    "masking tape": "Decorative masking tape",
+    "packaging tape": "Biodegradable packaging tape",
+    "napkins": "Paper napkins",
+    "streamers": "Party streamers",
+    "name tags": "Name tags with lanyards",
+    "folders": "Presentation folders",
+    "party bags": "Paper party bags",
+    "banner roll": "Rolls of banner paper (36-inch width)",
+    "large poster paper": "Large poster paper (24x36 inches)",
+}
+
+_NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+
+
+def _singular(word: str) -> str:
+    """Fold a plural English word to its singular form (good enough for catalog names)."""
+    if len(word) > 3 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith(("ches", "shes", "xes", "sses")):
+        return word[:-2]
+    if len(word) > 2 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize an item name for lookup.
+
+    The name is lower-cased, split on anything that is not a letter or digit, each word is
+    folded to its singular form and the words are joined without separators, so spacing and
+    hyphenation do not matter ("card stock" and "Cardstock" normalize alike).
+
+    Args:
+        name (str): The item name as given.
+
+    Returns:
+        str: The lookup key.
+    """
+    words = _NON_ALPHANUMERIC.split(str(name).lower())
+    return "".join(_singular(word) for word in words if word)
+
+
+class Catalog:
+    """A hash index of catalog records by normalized item name and alias."""
+
+    def __init__(self, records: Iterable[Dict], aliases: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            records (Iterable[Dict]): Catalog records, each with at least an 'item_name' key.
+            aliases (Dict[str, str], optional): Alternative names mapped to catalog names.
+                                                Default is `DEFAULT_ALIASES`.
+
+        Raises:
+            ValueError: If two catalog names normalize to the same key.
+        """
+        self._records: List[Dict] = list(records)
+        self._index: Dict[str, Dict] = {}
+        for record in self._records:
+            key = normalize_name(record["item_name"])
+            existing = self._index.get(key)
+            if existing is not None:
+                raise ValueError(
+                    f"Catalog names '{existing['item_name']}' and '{record['item_name']}' normalize to the same key"
+                )
+            self._index[key] = record
+
+        for alias, item_name in (DEFAULT_ALIASES if aliases is None else aliases).items():
+            self.register_alias(alias, item_name)
+
+    def register_alias(self, alias: str, item_name: str) -> None:
+        """
+        Make `alias` resolve to the catalog item `item_name`.
+
+        Args:
+            alias (str): The alternative name.
+            item_name (str): A name (or alias) that already resolves to a catalog item.
+
+        Raises:
+            KeyError: If `item_name` does not resolve.
+            ValueError: If `alias` already resolves to a different item.
+        """
+        record = self.resolve(item_name)
+        if record is None:
+            raise KeyError(f"Cannot alias '{alias}' to unknown item '{item_name}'")
+        key = normalize_name(alias)
+        existing = self._index.get(key)
+        if existing is not None and existing is not record:
+            raise ValueError(f"Alias '{alias}' already resolves to '{existing['item_name']}'")
+        self._index[key] = record
+
+    def resolve(self, name: str) -> Optional[Dict]:
+        """Return the catalog record `name` refers to, or None if it is not a known name or alias."""
+        if name is None:
+            return None
+        return self._index.get(normalize_name(name))
+
+    def canonical_name(self, name: str) -> Optional[str]:
+        """Return the lower-cased catalog name (the database key) `name` refers to, or None."""
+        record = self.resolve(name)
+        return None if record is None else record["item_name"].lower()
+
+    def suggest(self, name: str, limit: int = 3) -> List[str]:
+        """Return up to `limit` catalog names whose normalized form is closest to that of `name`."""
+        keys = difflib.get_close_matches(normalize_name(name), self._index.keys(), n=limit * 2, cutoff=0.6)
+        suggestions = []
+        for key in keys:
+            item_name = self._index[key]["item_name"]
+            if item_name not in suggestions:
+                suggestions.append(item_name)
+        return suggestions[:limit]
+
+    def invalid_name_message(self, name: str) -> str:
+        """The error text tools return for a name that does not resolve, with close matches if any."""
+        message = f"Invalid item name: {name} is not in paper_supplies list"
+        suggestions = self.suggest(name)
+        if suggestions:
+            message += f" (did you mean: {', '.join(suggestions)}?)"
+        return message
+
+    def names(self) -> List[str]:
+        """Catalog names in catalog order."""
+        return [record["item_name"] for record in self._records]
+
+    def __contains__(self, name: str) -> bool:
+        return self.resolve(name) is not None
+
+    def __len__(self) -> int:
+        return len(self._records)
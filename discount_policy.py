@@ -0,0 +1,157 @@
+"""
+Discount policy learned offline from the quote history.
+
+Every historical quote implies an effective discount: how far its `total_amount` is below the
+list price of the items its request asks for. `DiscountPolicy.fit` computes these for all
+quotes at once and takes their median per (job_type, order_size, event_type) cell, and per
+every coarser cell where some of the three keys are left open (`WILDCARD`). A lookup then tries
+a fixed sequence of cells from the most specific to the overall median (`FALLBACK_ORDER`), so
+it costs at most eight dictionary lookups however long the history is.
+
+The quote history is noisy: some totals are in cents or error markers (-1), which put them
+far from the list price on either side. Effective discounts further than
+`MAX_DISCOUNT_PERCENTAGE` from 0 in either direction are dropped as bad data; the rest count,
+with markups (quotes a little above list price) counted as a 0% discount, so they pull a
+cell's median towards no discount instead of being ignored. A cell is kept only if at least
+`MIN_QUOTES` quotes back it (the overall cell is always kept).
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+KEYS = ("job_type", "order_size", "event_type")
+
+# Stands for "any value" in a table key
+WILDCARD = "*"
+
+# Which keys a cell is specific to, in lookup order: all three first, then the order size
+# (which drives the bulk discount most) with either of the others, and so on
+FALLBACK_ORDER = (
+    (True, True, True),
+    (True, True, False),
+    (False, True, True),
+    (True, False, True),
+    (False, True, False),
+    (True, False, False),
+    (False, False, True),
+    (False, False, False),
+)
+
+# Effective discounts outside [-MAX_DISCOUNT_PERCENTAGE, MAX_DISCOUNT_PERCENTAGE] are treated as bad data
+MAX_DISCOUNT_PERCENTAGE = 50.0
+
+# Quotes a cell needs to be kept
+MIN_QUOTES = 3
+
+
+def effective_discounts(total_amounts: np.ndarray, list_prices: np.ndarray) -> np.ndarray:
+    """
+    The discount percentage each quote gave off the list price of its items.
+
+    Args:
+        total_amounts (np.ndarray): The quoted totals.
+        list_prices (np.ndarray): The list price of the same quotes' items (NaN if unknown).
+
+    Returns:
+        np.ndarray: 100 * (1 - total / list price), clamped at 0 for markups; NaN where either
+                    amount is not positive or the result is more than
+                    MAX_DISCOUNT_PERCENTAGE from 0.
+    """
+    total_amounts = np.asarray(total_amounts, dtype=np.float64)
+    list_prices = np.asarray(list_prices, dtype=np.float64)
+    valid = (total_amounts > 0) & (list_prices > 0)
+    discounts = np.full(total_amounts.shape, np.nan)
+    discounts[valid] = 100 * (1 - total_amounts[valid] / list_prices[valid])
+    discounts[np.abs(discounts) > MAX_DISCOUNT_PERCENTAGE] = np.nan
+    # A quote above list price gave no discount (NaN stays NaN)
+    return np.maximum(discounts, 0)
+
+
+def _normalize_key(value: Optional[str]) -> str:
+    return str(value or "").strip().lower()
+
+
+class DiscountPolicy:
+    """Median effective discount per (job_type, order_size, event_type) cell, with coarser fallbacks."""
+
+    def __init__(self, table: Dict[Tuple[str, str, str], Tuple[float, int]], version: int):
+        """
+        Args:
+            table (Dict[Tuple[str, str, str], Tuple[float, int]]): Cell key (lower-cased values
+                or WILDCARD) mapped to (discount percentage, number of quotes).
+            version (int): The 'quotes' table version the table was fitted at.
+        """
+        self.table = dict(table)
+        self.version = int(version)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    @classmethod
+    def fit(cls, quotes: pd.DataFrame, version: int) -> "DiscountPolicy":
+        """
+        Build the table.
+
+        Args:
+            quotes (pd.DataFrame): One row per quote with 'job_type', 'order_size',
+                                   'event_type', 'total_amount' and 'list_price' columns.
+            version (int): The 'quotes' table version the quotes were read at.
+
+        Returns:
+            DiscountPolicy: The fitted policy.
+        """
+        frame = pd.DataFrame({key: quotes[key].map(_normalize_key) for key in KEYS})
+        frame["discount"] = effective_discounts(quotes["total_amount"].to_numpy(), quotes["list_price"].to_numpy())
+        frame = frame.dropna(subset=["discount"])
+
+        table = {}
+        for specific in FALLBACK_ORDER:
+            cells = frame.copy()
+            for key, keep in zip(KEYS, specific):
+                if not keep:
+                    cells[key] = WILDCARD
+            stats = cells.groupby(list(KEYS))["discount"].agg(["median", "size"])
+            if any(specific):
+                stats = stats[stats["size"] >= MIN_QUOTES]
+            table.update(
+                (cell, (round(float(median), 2), int(size)))
+                for cell, median, size in zip(stats.index, stats["median"], stats["size"])
+            )
+        table.setdefault((WILDCARD,) * len(KEYS), (0.0, 0))
+        return cls(table, version)
+
+    def lookup(
+        self, job_type: Optional[str], order_size: Optional[str], event_type: Optional[str]
+    ) -> Tuple[Tuple[str, str, str], float, int]:
+        """
+        The discount of the most specific cell that matches.
+
+        Args:
+            job_type (str, optional): The customer's job; empty or None matches any.
+            order_size (str, optional): The order size; empty or None matches any.
+            event_type (str, optional): The event; empty or None matches any.
+
+        Returns:
+            Tuple[Tuple[str, str, str], float, int]: The matched cell key, its discount
+                                                     percentage and the number of quotes behind it.
+        """
+        values = tuple(_normalize_key(value) for value in (job_type, order_size, event_type))
+        for specific in FALLBACK_ORDER:
+            if any(keep and not value for keep, value in zip(specific, values)):
+                continue
+            cell = tuple(value if keep else WILDCARD for value, keep in zip(values, specific))
+            entry = self.table.get(cell)
+            if entry is not None:
+                return (cell, *entry)
+        cell = (WILDCARD,) * len(KEYS)
+        return (cell, *self.table[cell])
+
+    def rows(self) -> List[tuple]:
+        """(job_type, order_size, event_type, discount_percentage, quotes) per cell, for storage."""
+        return [(*cell, discount, quotes) for cell, (discount, quotes) in sorted(self.table.items())]
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[tuple], version: int) -> "DiscountPolicy":
+        """Rebuild a policy from the output of `rows`."""
+        return cls({tuple(row[:3]): (float(row[3]), int(row[4])) for row in rows}, version)
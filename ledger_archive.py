@@ -0,0 +1,422 @@
+"""
+Monthly columnar archive of the transaction ledger.
+
+`archive_closed_months` moves every ledger row dated before the open month out of the live
+'transactions' table into one Arrow IPC file per month, next to the database
+(`<database>.archive/YYYY-MM.<first id>.arrow`). Each file is recorded in
+'ledger_archive_partitions', and its per-item totals (net units, net cash, sales units and
+revenue, stock order cost) are recorded in 'ledger_archive_manifest'.
+
+As-of queries then combine three sources:
+- manifest totals for archived months that end on or before the cutoff day,
+- a memory-mapped read of the partitions of the month containing the cutoff, if it is archived,
+- the live table, through the usual projection and checkpoints.
+
+Live checkpoints only cover the live table, so they are cleared whenever rows are archived.
+A row written later with a date in an archived month stays in the live table until the next
+`archive_closed_months` run, which archives it into an extra partition for that month.
+"""
+import calendar
+import logging
+import os
+import threading
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import repository
+
+# Column types of a partition file
+PARTITION_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("item_name", pa.string()),
+    ("transaction_type", pa.string()),
+    ("units", pa.int64()),
+    ("price", pa.float64()),
+    ("transaction_date", pa.string()),
+    ("transaction_day", pa.int32()),
+    ("unit_delta", pa.int64()),
+    ("cash_delta", pa.float64()),
+])
+
+
+def archive_dir(engine) -> str:
+    """
+    Return the directory that holds the partition files of a database.
+
+    Raises:
+        ValueError: If the engine is not backed by a database file.
+    """
+    database = engine.url.database
+    if not database or database == ":memory:":
+        raise ValueError("Only file databases can be archived")
+    return f"{database}.archive"
+
+
+def _month_bounds(day: int) -> Tuple[int, int]:
+    """Return the day numbers of the first and last day of the month containing `day`."""
+    first = date.fromordinal(day).replace(day=1)
+    last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+    return first.toordinal(), last.toordinal()
+
+
+def read_partition(path: str) -> pa.Table:
+    """Memory-map a partition file and return its rows as an Arrow table (no copy is made)."""
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _partition_table(records: List[Dict]) -> pa.Table:
+    """Build a partition table from ledger records, adding each row's signed unit and cash movement."""
+    for record in records:
+        is_stock_order = record["transaction_type"] == "stock_orders"
+        units = record["units"] or 0
+        price = record["price"] or 0.0
+        record["unit_delta"] = units if is_stock_order else -units
+        record["cash_delta"] = -price if is_stock_order else price
+    return pa.Table.from_pylist(records, schema=PARTITION_SCHEMA)
+
+
+def _manifest_rows(table: pa.Table, path: str, month_start_day: int, month_end_day: int) -> List[Dict]:
+    """Per-item totals of one partition, in the shape of 'ledger_archive_manifest'."""
+    is_sale = pc.equal(table["transaction_type"], "sales")
+    table = table.append_column("sales_units", pc.if_else(is_sale, pc.fill_null(table["units"], 0), 0))
+    table = table.append_column("sales_revenue", pc.if_else(is_sale, table["price"], 0.0))
+    table = table.append_column("stock_order_cost", pc.if_else(is_sale, 0.0, table["price"]))
+    totals = table.group_by("item_name", use_threads=False).aggregate([
+        ("unit_delta", "sum"),
+        ("cash_delta", "sum"),
+        ("sales_units", "sum"),
+        ("sales_revenue", "sum"),
+        ("stock_order_cost", "sum"),
+        ("transaction_day", "max"),
+    ])
+    return [
+        {
+            "path": path,
+            "month_start_day": month_start_day,
+            "month_end_day": month_end_day,
+            "item_name": row["item_name"],
+            "units": row["unit_delta_sum"],
+            "cash": row["cash_delta_sum"],
+            "sales_units": row["sales_units_sum"],
+            "sales_revenue": row["sales_revenue_sum"],
+            "stock_order_cost": row["stock_order_cost_sum"],
+            "last_day": row["transaction_day_max"],
+        }
+        for row in totals.to_pylist()
+    ]
+
+
+def archive_closed_months(engine, before_day: Optional[int] = None, as_of_date: Optional[str] = None) -> List[str]:
+    """
+    Move every live ledger row dated before the open month into per-month partition files.
+
+    The open month is the month of `as_of_date`, not that of the latest ledger row: restocks
+    write stock orders dated on their future delivery day, which must not close the month
+    that is still being traded in.
+
+    Files are written first; the manifest, the partition list and the removal of the archived
+    rows from the live table are then committed in one database transaction. If that fails,
+    the new files are deleted again.
+
+    Args:
+        engine (Engine): A SQLAlchemy engine connected to the SQLite database.
+        before_day (int, optional): Archive rows dated before this day number. Defaults to the
+                                    first day of the month of `as_of_date`.
+        as_of_date (str, optional): The current date (YYYY-MM-DD), e.g. the date of the request
+                                    being served. Defaults to today.
+
+    Returns:
+        List[str]: The paths of the partition files written (empty if nothing was archived).
+    """
+    if before_day is None:
+        today = repository.to_day_number(as_of_date) if as_of_date else date.today().toordinal()
+        before_day = _month_bounds(today)[0]
+    with engine.connect() as conn:
+        records = repository.fetch_records(conn, "archive.live_rows_before", {"before_day": before_day})
+    if not records:
+        return []
+
+    # Group the rows by month
+    months: Dict[Tuple[int, int], List[Dict]] = {}
+    for record in records:
+        months.setdefault(_month_bounds(record["transaction_day"]), []).append(record)
+
+    directory = archive_dir(engine)
+    os.makedirs(directory, exist_ok=True)
+    partitions, manifest, written = [], [], []
+    try:
+        for (month_start_day, month_end_day), rows in sorted(months.items()):
+            table = _partition_table(rows)
+            path = os.path.join(directory, f"{date.fromordinal(month_start_day):%Y-%m}.{rows[0]['id']}.arrow")
+            with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, PARTITION_SCHEMA) as writer:
+                writer.write_table(table)
+            written.append(path)
+
+            ids = table["id"].to_numpy()
+            partitions.append({
+                "path": path,
+                "month_start_day": month_start_day,
+                "month_end_day": month_end_day,
+                "row_count": len(rows),
+                "min_id": int(ids.min()),
+                "max_id": int(ids.max()),
+            })
+            manifest.extend(_manifest_rows(table, path, month_start_day, month_end_day))
+
+        with engine.begin() as conn:
+            repository.execute_many(conn, "archive.insert_partition", partitions)
+            repository.execute_many(conn, "archive.insert_manifest", manifest)
+            # Rows written since they were read are left alone
+            repository.execute(conn, "archive.delete_live_before", {
+                "before_day": before_day,
+                "max_id": max(record["id"] for record in records),
+            })
+            # Live checkpoints no longer match the live table
+            repository.execute(conn, "checkpoints.clear_stock")
+            repository.execute(conn, "checkpoints.clear_cash")
+    except Exception:
+        for path in written:
+            os.remove(path)
+        raise
+
+    return written
+
+
+def drop_archive(conn) -> None:
+    """
+    Delete every partition file and drop the archive tables.
+
+    Args:
+        conn: An open SQLAlchemy connection inside a transaction.
+    """
+    repository.execute(conn, "schema.create_archive_partitions")
+    for (path,) in repository.fetch_all(conn, "archive.partition_paths"):
+        if os.path.exists(path):
+            os.remove(path)
+    repository.execute(conn, "schema.drop_archive_partitions")
+    repository.execute(conn, "schema.drop_archive_manifest")
+
+
+def _rows_through(table: pa.Table, day: int) -> pa.Table:
+    return table.filter(pc.less_equal(table["transaction_day"], day))
+
+
+def partial_month(conn, day: int) -> Tuple[Dict[str, int], float]:
+    """
+    Sum the archived rows of the month containing `day` that are dated on or before it.
+
+    Only needed when that month is archived and `day` is not its last day; every other archived
+    month is covered by the manifest.
+
+    Returns:
+        tuple: (units per item name, net cash) of those rows.
+    """
+    units: Dict[str, int] = {}
+    cash = 0.0
+    for (path,) in repository.fetch_all(conn, "archive.partitions_containing_day", {"day": day}):
+        rows = _rows_through(read_partition(path), day)
+        cash += float(pc.sum(rows["cash_delta"]).as_py() or 0.0)
+        items = rows.filter(pc.is_valid(rows["item_name"]))
+        for row in items.group_by("item_name", use_threads=False).aggregate([("unit_delta", "sum")]).to_pylist():
+            units[row["item_name"]] = units.get(row["item_name"], 0) + row["unit_delta_sum"]
+    return units, cash
+
+
+def sales_through(conn, day: int) -> Dict[Optional[str], Tuple[int, float]]:
+    """
+    Archived sales units and revenue per item through `day`.
+
+    Returns:
+        Dict: item name (None for rows without an item) -> (units sold, revenue).
+    """
+    sales = {
+        item_name: (int(units), float(revenue))
+        for item_name, units, revenue in repository.fetch_all(conn, "archive.sales_through_day", {"day": day})
+    }
+    for (path,) in repository.fetch_all(conn, "archive.partitions_containing_day", {"day": day}):
+        rows = _rows_through(read_partition(path), day)
+        rows = rows.filter(pc.equal(rows["transaction_type"], "sales"))
+        for item_name, units, revenue in zip(
+            rows["item_name"].to_pylist(), rows["units"].to_pylist(), rows["price"].to_pylist()
+        ):
+            previous_units, previous_revenue = sales.get(item_name, (0, 0.0))
+            sales[item_name] = (previous_units + (units or 0), previous_revenue + revenue)
+    return sales
+
+
+def total_between(conn, transaction_type: str, start_day: int, end_day: int) -> Optional[float]:
+    """
+    Archived sum of 'price' for one transaction type between two days (inclusive).
+
+    Months that lie entirely inside the range use the manifest; the partitions of months that
+    straddle a bound are memory-mapped and filtered.
+
+    Returns:
+        float or None: The total, or None if no archived month overlaps the range.
+    """
+    column = "sales_revenue" if transaction_type == "sales" else "stock_order_cost"
+    overlapping = repository.fetch_all(
+        conn, "archive.partitions_overlapping", {"start_day": start_day, "end_day": end_day}
+    )
+    if not overlapping:
+        return None
+
+    total = 0.0
+    for path, month_start_day, month_end_day in overlapping:
+        if start_day <= month_start_day and month_end_day <= end_day:
+            total += _manifest_total(conn, path, column)
+            continue
+        table = read_partition(path)
+        days = table["transaction_day"]
+        rows = table.filter(pc.and_(
+            pc.and_(pc.greater_equal(days, start_day), pc.less_equal(days, end_day)),
+            pc.equal(table["transaction_type"], transaction_type),
+        ))
+        total += float(pc.sum(rows["price"]).as_py() or 0.0)
+    return total
+
+
+def sales(conn) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    Every archived sale with an item, e.g. to seed a demand history.
+
+    Returns:
+        Tuple: (item names, day numbers, units, IDs, highest archived ID or 0).
+    """
+    item_names: List[str] = []
+    days, units, ids = [], [], []
+    max_id = 0
+    for (path,) in repository.fetch_all(conn, "archive.partition_paths"):
+        table = read_partition(path)
+        if table.num_rows:
+            max_id = max(max_id, int(pc.max(table["id"]).as_py()))
+        rows = table.filter(pc.and_(pc.equal(table["transaction_type"], "sales"), pc.is_valid(table["item_name"])))
+        item_names.extend(rows["item_name"].to_pylist())
+        days.append(rows["transaction_day"].to_numpy())
+        units.append(rows["units"].to_numpy())
+        ids.append(rows["id"].to_numpy())
+    if not days:
+        return [], np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0
+    return item_names, np.concatenate(days), np.concatenate(units), np.concatenate(ids), max_id
+
+
+def movements(conn, item_names: List[str], start_day: int, end_day: int) -> List[tuple]:
+    """
+    Archived stock movements of some items between two days (inclusive).
+
+    Returns:
+        List[tuple]: One (item_name, day, inbound units, outbound units) tuple per row.
+    """
+    found = []
+    for path, _, _ in repository.fetch_all(
+        conn, "archive.partitions_overlapping", {"start_day": start_day, "end_day": end_day}
+    ):
+        table = read_partition(path)
+        days = table["transaction_day"]
+        rows = table.filter(pc.and_(
+            pc.and_(pc.greater_equal(days, start_day), pc.less_equal(days, end_day)),
+            pc.is_in(table["item_name"], value_set=pa.array(item_names, type=pa.string())),
+        ))
+        for item_name, day, transaction_type, units in zip(
+            rows["item_name"].to_pylist(), rows["transaction_day"].to_pylist(),
+            rows["transaction_type"].to_pylist(), rows["units"].to_pylist(),
+        ):
+            inbound = transaction_type == "stock_orders"
+            found.append((item_name, day, units if inbound else 0, 0 if inbound else units))
+    return found
+
+
+def _manifest_total(conn, path: str, column: str) -> float:
+    """Sum one manifest column ('sales_revenue' or 'stock_order_cost') over every item of a partition."""
+    sales_revenue, stock_order_cost = repository.fetch_one(conn, "archive.partition_totals", {"path": path})
+    return float(sales_revenue if column == "sales_revenue" else stock_order_cost)
+
+
+def _record(table: pa.Table, index: int) -> Dict:
+    """One partition row as a 'transactions' record."""
+    row = table.slice(index, 1).to_pylist()[0]
+    return {key: row[key] for key in ("id", "item_name", "transaction_type", "units", "price", "transaction_date")}
+
+
+def transaction(conn, transaction_id: int, day: int) -> Optional[Dict]:
+    """The archived record with `transaction_id` if it is dated on or before `day`, else None."""
+    for (path,) in repository.fetch_all(conn, "archive.partition_for_id", {"transaction_id": transaction_id}):
+        table = read_partition(path)
+        matches = np.flatnonzero(
+            (table["id"].to_numpy() == transaction_id) & (table["transaction_day"].to_numpy() <= day)
+        )
+        if matches.size:
+            return _record(table, int(matches[0]))
+    return None
+
+
+def recent_transactions(conn, day: int, limit: int) -> List[Dict]:
+    """
+    The latest `limit` archived records through `day`, newest first.
+
+    Partitions are read newest month first and reading stops once `limit` rows are found and
+    every partition of that month has been read.
+    """
+    found: List[Dict] = []
+    last_month_end_day: Optional[int] = None
+    for path, month_end_day in repository.fetch_all(conn, "archive.partitions_through_day", {"day": day}):
+        if len(found) >= limit and last_month_end_day is not None and month_end_day < last_month_end_day:
+            break
+        last_month_end_day = month_end_day
+        table = read_partition(path)
+        days = table["transaction_day"].to_numpy()
+        ids = table["id"].to_numpy()
+        positions = np.flatnonzero(days <= day)
+        order = np.lexsort((-ids[positions], -days[positions].astype(np.int64)))
+        found.extend(_record(table, int(positions[i])) for i in order[:limit])
+    found.sort(key=lambda record: (repository.to_day_number(record["transaction_date"]), record["id"]), reverse=True)
+    return found[:limit]
+
+
+class Archiver:
+    """
+    Background thread that archives closed months of one database at a fixed interval.
+
+        archiver = Archiver(db_engine, interval_seconds=3600)
+        archiver.start()
+        ...
+        archiver.stop()
+    """
+
+    def __init__(self, engine, interval_seconds: float = 3600.0, current_date: Optional[Callable[[], str]] = None):
+        """
+        Args:
+            engine (Engine): A SQLAlchemy engine connected to the SQLite database.
+            interval_seconds (float, optional): Pause between runs. Default is 3600.
+            current_date (Callable[[], str], optional): Returns the current date (YYYY-MM-DD)
+                                                       each run, e.g. that of a simulation.
+                                                       Default is today.
+        """
+        self.engine = engine
+        self.interval_seconds = interval_seconds
+        self._current_date = current_date or (lambda: None)
+        self.runs = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ledger-archiver", daemon=True)
+
+    def start(self) -> "Archiver":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                archive_closed_months(self.engine, as_of_date=self._current_date())
+            except Exception:
+                logging.exception("Archiving closed months failed")
+            self.runs += 1
+            self._stopped.wait(self.interval_seconds)
@@ -0,0 +1,245 @@
+"""
+Write-invalidated caches for the lookups tools repeat within a run.
+
+- `StockCache` is a bounded LRU map from (item_name, day) to the stock at the end of that
+  day. A ledger write for an item on day D can only change that item's stock on D and later,
+  so `invalidate` drops exactly those entries and keeps everything else. Entries are also
+  tagged with the ledger version in 'table_versions' they were read at: every ledger write
+  bumps it, so writes made by other tool contexts or processes (which cannot call
+  `invalidate` here) empty the cache the next time a lookup reads a newer version.
+- `ReferenceCache` holds the 'inventory' reference rows (category, unit price, minimum stock
+  level) by item. Triggers on 'inventory' bump a version number in 'table_versions', and the
+  rows are reloaded only when that version differs from the one they were loaded at.
+
+Both count hits and misses; `LookupCache.stats` reports them.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import repository
+
+
+class StockCache:
+    """A bounded, thread-safe LRU cache of stock levels keyed by (item_name, day)."""
+
+    def __init__(self, max_entries: int = 4096):
+        """
+        Args:
+            max_entries (int, optional): Entries kept before the least recently used is evicted.
+                                         Default is 4096.
+        """
+        self.max_entries = max(int(max_entries), 1)
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+            # Cached days per item, for invalidation without scanning every key
+            self._days_by_item: Dict[str, set] = {}
+            # Ledger version the entries are current at; None until the first lookup
+            self.version: Optional[int] = None
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _adopt(self, version: int) -> None:
+        """Empty the cache and move it to a newer ledger version (the lock must be held)."""
+        self._entries.clear()
+        self._days_by_item.clear()
+        self.version = version
+
+    def get(self, item_name: str, day: int, version: int) -> Optional[int]:
+        """
+        Return the cached stock of an item at the end of `day`, or None on a miss.
+
+        Args:
+            item_name (str): The item.
+            day (int): The day number.
+            version (int): The ledger version read just before; a newer one than the cache's
+                           empties the cache, an older one (a lagging reader) is just a miss.
+        """
+        key = (item_name, day)
+        with self._lock:
+            if version != self.version:
+                if self.version is None or version > self.version:
+                    self._adopt(version)
+                self.misses += 1
+                return None
+            stock = self._entries.get(key)
+            if stock is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return stock
+
+    def put(self, item_name: str, day: int, stock: int, version: int) -> None:
+        """
+        Cache the stock of an item at the end of `day`, evicting the least recently used entry if full.
+
+        The stock must have been read after `version` was; it is not cached if the ledger has
+        moved on since, because a write may have landed between the two reads.
+        """
+        key = (item_name, day)
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = int(stock)
+            self._entries.move_to_end(key)
+            self._days_by_item.setdefault(item_name, set()).add(day)
+            while len(self._entries) > self.max_entries:
+                (old_item, old_day), _ = self._entries.popitem(last=False)
+                self._days_by_item[old_item].discard(old_day)
+
+    def invalidate(self, first_days: Dict[str, int], versions: Optional[Tuple[int, int]] = None) -> int:
+        """
+        Drop the entries a ledger write made stale.
+
+        Args:
+            first_days (Dict[str, int]): Each written item mapped to the earliest day written.
+            versions (Tuple[int, int], optional): The ledger version before and after the write.
+                If the cache was current just before it, it moves to the new version and keeps
+                the entries the write did not touch; if other writes came in between, it is emptied.
+
+        Returns:
+            int: The number of entries dropped.
+        """
+        dropped = 0
+        with self._lock:
+            if versions is not None:
+                before, after = versions
+                if self.version == before:
+                    self.version = after
+                elif self.version is not None and self.version < after:
+                    dropped = len(self._entries)
+                    self._adopt(after)
+                    return dropped
+            for item_name, first_day in first_days.items():
+                days = self._days_by_item.get(item_name)
+                if not days:
+                    continue
+                stale = [day for day in days if day >= first_day]
+                for day in stale:
+                    del self._entries[(item_name, day)]
+                    days.discard(day)
+                dropped += len(stale)
+        return dropped
+
+
+class ReferenceCache:
+    """The 'inventory' reference rows, reloaded only when the table's version changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        """Forget the loaded rows and reset the counters."""
+        with self._lock:
+            self._version: Optional[int] = None
+            self._rows: Dict[str, Tuple[str, float, int]] = {}
+            # Values computed from the current rows, dropped with them
+            self._derived: Dict[str, Any] = {}
+            self.hits = 0
+            self.misses = 0
+            self.reloads = 0
+
+    def rows(self, conn) -> Dict[str, Tuple[str, float, int]]:
+        """
+        Return every inventory item's (category, unit_price, min_stock_level), by item name.
+
+        One version lookup decides whether the cached rows are still current.
+
+        Args:
+            conn: An open SQLAlchemy connection.
+        """
+        version = repository.fetch_scalar(conn, "inventory.version")
+        with self._lock:
+            if version is not None and version == self._version:
+                self.hits += 1
+                return self._rows
+            self.misses += 1
+        rows = {
+            item_name: (category, unit_price, min_stock_level)
+            for item_name, category, unit_price, min_stock_level in repository.fetch_all(conn, "inventory.reference")
+        }
+        with self._lock:
+            self._rows, self._version = rows, version
+            self._derived = {}
+            self.reloads += 1
+        return rows
+
+    def derived(self, conn, key: str, build: Callable[[Dict[str, Tuple[str, float, int]]], Any]) -> Any:
+        """
+        Return a value computed from the reference rows, recomputing it only after they reload.
+
+        Args:
+            conn: An open SQLAlchemy connection.
+            key (str): Name of the derived value.
+            build (Callable): Computes the value from the rows returned by `rows`.
+        """
+        rows = self.rows(conn)
+        with self._lock:
+            if rows is self._rows and key in self._derived:
+                return self._derived[key]
+        value = build(rows)
+        with self._lock:
+            if rows is self._rows:
+                self._derived[key] = value
+        return value
+
+    def item(self, conn, item_name: str) -> Optional[Tuple[str, float, int]]:
+        """Return one item's (category, unit_price, min_stock_level), or None if it is not in inventory."""
+        return self.rows(conn).get(item_name)
+
+
+class LookupCache:
+    """The stock and reference caches of one tool context."""
+
+    def __init__(self, max_stock_entries: int = 4096):
+        """
+        Args:
+            max_stock_entries (int, optional): Size bound of the stock cache. Default is 4096.
+        """
+        self.stock = StockCache(max_stock_entries)
+        self.reference = ReferenceCache()
+
+    def clear(self) -> None:
+        """Empty both caches, e.g. after the database is re-initialized."""
+        self.stock.clear()
+        self.reference.clear()
+
+    def invalidate_rows(self, rows: Iterable[Dict], versions: Optional[Tuple[int, int]] = None) -> int:
+        """
+        Drop the stock entries that newly written ledger rows made stale.
+
+        Args:
+            rows (Iterable[Dict]): Ledger rows with 'item_name' and 'transaction_day'.
+            versions (Tuple[int, int], optional): The ledger version before and after the write
+                                                  (see `StockCache.invalidate`).
+
+        Returns:
+            int: The number of entries dropped.
+        """
+        first_days: Dict[str, int] = {}
+        for row in rows:
+            item_name, day = row["item_name"], row["transaction_day"]
+            if item_name is not None and day < first_days.get(item_name, day + 1):
+                first_days[item_name] = day
+        return self.stock.invalidate(first_days, versions)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit and miss counters (and sizes / reloads) of both caches."""
+        return {
+            "stock": {"hits": self.stock.hits, "misses": self.stock.misses, "entries": len(self.stock)},
+            "reference": {
+                "hits": self.reference.hits,
+                "misses": self.reference.misses,
+                "reloads": self.reference.reloads,
+            },
+        }
@@ -0,0 +1,280 @@
+"""
+In-memory ledger backend for simulation runs.
+
+`NumpyLedger` keeps the transaction ledger in preallocated NumPy column arrays: item codes,
+transaction types and day numbers are stored as integers, and each row also carries its signed
+stock and cash movement. Stock and cash as of a day are masked vectorized sums over those
+columns, so what-if replays skip SQLite and pandas entirely. Nothing is persisted.
+
+Rows use the same normalized shape `create_transactions` writes to the 'transactions' table:
+'item_name', 'transaction_type', 'units', 'price', 'transaction_date' and 'transaction_day'
+(see `repository.to_day_number`).
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import repository
+
+# Integer codes of the 'transaction_type' column
+TRANSACTION_TYPES = ("stock_orders", "sales")
+
+# Item code of ledger rows without an item (e.g. the starting cash balance)
+NO_ITEM = -1
+
+
+class NumpyLedger:
+    """An append-only transaction ledger held in NumPy column arrays."""
+
+    def __init__(self, capacity: int = 4096):
+        """
+        Args:
+            capacity (int, optional): Number of rows to preallocate. The arrays double in size
+                                      whenever they fill up. Default is 4096.
+        """
+        self._capacity = max(int(capacity), 1)
+        self._allocate(self._capacity)
+        # Held by callers that read stock and then append rows based on it (e.g. order processing)
+        self.lock = threading.RLock()
+        self.clear()
+
+    def _allocate(self, capacity: int) -> None:
+        """Allocate empty column arrays with room for `capacity` rows."""
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._items = np.zeros(capacity, dtype=np.int32)
+        self._types = np.zeros(capacity, dtype=np.int8)
+        self._days = np.zeros(capacity, dtype=np.int32)
+        self._units = np.zeros(capacity, dtype=np.int64)
+        self._prices = np.zeros(capacity, dtype=np.float64)
+        self._unit_deltas = np.zeros(capacity, dtype=np.int64)
+        self._cash_deltas = np.zeros(capacity, dtype=np.float64)
+        self._dates = np.empty(capacity, dtype=object)
+
+    def _grow(self, required: int) -> None:
+        """Reallocate the column arrays so they hold at least `required` rows."""
+        capacity = self._capacity
+        while capacity < required:
+            capacity *= 2
+        old = {name: getattr(self, name)[:self._size] for name in self._columns()}
+        self._allocate(capacity)
+        for name, values in old.items():
+            getattr(self, name)[:self._size] = values
+        self._capacity = capacity
+
+    @staticmethod
+    def _columns() -> List[str]:
+        return ["_ids", "_items", "_types", "_days", "_units", "_prices", "_unit_deltas", "_cash_deltas", "_dates"]
+
+    def clear(self) -> None:
+        """Drop every row and item code."""
+        self._size = 0
+        self._next_id = 1
+        self._item_names: List[str] = []
+        self._item_codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _item_code(self, item_name: Optional[str]) -> int:
+        """Return the integer code of an item, assigning a new one on first sight."""
+        if item_name is None:
+            return NO_ITEM
+        code = self._item_codes.get(item_name)
+        if code is None:
+            code = len(self._item_names)
+            self._item_codes[item_name] = code
+            self._item_names.append(item_name)
+        return code
+
+    def append(self, rows: List[Dict], ids: Optional[List[int]] = None) -> List[int]:
+        """
+        Append normalized ledger rows.
+
+        Args:
+            rows (List[Dict]): Rows with keys 'item_name', 'transaction_type', 'units', 'price',
+                               'transaction_date' and 'transaction_day'.
+            ids (List[int], optional): IDs to keep (e.g. when loading an existing ledger).
+                                       New IDs continue from the highest one by default.
+
+        Returns:
+            List[int]: The IDs of the appended rows, in input order.
+        """
+        count = len(rows)
+        if count == 0:
+            return []
+        if self._size + count > self._capacity:
+            self._grow(self._size + count)
+
+        if ids is None:
+            ids = list(range(self._next_id, self._next_id + count))
+        block = slice(self._size, self._size + count)
+
+        types = np.array([TRANSACTION_TYPES.index(row["transaction_type"]) for row in rows], dtype=np.int8)
+        units = np.array([row["units"] or 0 for row in rows], dtype=np.int64)
+        prices = np.array([row["price"] or 0.0 for row in rows], dtype=np.float64)
+        is_stock_order = types == TRANSACTION_TYPES.index("stock_orders")
+
+        self._ids[block] = ids
+        self._items[block] = [self._item_code(row["item_name"]) for row in rows]
+        self._types[block] = types
+        self._days[block] = [row["transaction_day"] for row in rows]
+        self._units[block] = units
+        self._prices[block] = prices
+        self._unit_deltas[block] = np.where(is_stock_order, units, -units)
+        self._cash_deltas[block] = np.where(is_stock_order, -prices, prices)
+        self._dates[block] = [row["transaction_date"] for row in rows]
+
+        self._size += count
+        self._next_id = max(self._next_id, int(max(ids)) + 1)
+        return list(ids)
+
+    def load(self, engine) -> "NumpyLedger":
+        """
+        Replace the contents with the 'transactions' table of a SQLite database.
+
+        Args:
+            engine (Engine): A SQLAlchemy engine connected to an initialized database.
+
+        Returns:
+            NumpyLedger: This ledger, for chaining.
+        """
+        with engine.connect() as conn:
+            records = repository.fetch_records(conn, "ledger.all")
+        self.clear()
+        self.append(records, ids=[record["id"] for record in records])
+        return self
+
+    def _through(self, day: int) -> np.ndarray:
+        """Boolean mask of the rows dated on or before `day`."""
+        return self._days[:self._size] <= day
+
+    def stock_level(self, item_name: str, day: int) -> int:
+        """Net units of one item at the end of `day`."""
+        code = self._item_codes.get(item_name)
+        if code is None:
+            return 0
+        mask = self._through(day) & (self._items[:self._size] == code)
+        return int(self._unit_deltas[:self._size][mask].sum())
+
+    def stock_as_of(self, day: int) -> Dict[str, int]:
+        """Net units of every item in the ledger at the end of `day` (non-positive included)."""
+        items = self._items[:self._size]
+        mask = self._through(day) & (items != NO_ITEM)
+        totals = np.bincount(
+            items[mask], weights=self._unit_deltas[:self._size][mask], minlength=len(self._item_names)
+        )
+        return {name: int(total) for name, total in zip(self._item_names, totals)}
+
+    def net_units(self, item_names: List[str]) -> Dict[str, int]:
+        """Net units of some items across every row, whatever its day (like the 'stock_levels' projection)."""
+        items = self._items[:self._size]
+        deltas = self._unit_deltas[:self._size]
+        units = {}
+        for item_name in item_names:
+            code = self._item_codes.get(item_name)
+            units[item_name] = 0 if code is None else int(deltas[items == code].sum())
+        return units
+
+    def cash_as_of(self, day: int) -> float:
+        """Net cash (sales minus stock orders) at the end of `day`."""
+        return float(self._cash_deltas[:self._size][self._through(day)].sum())
+
+    def total_between(self, transaction_type: str, start_day: int, end_day: int) -> Optional[float]:
+        """Sum of 'price' over one transaction type between two days (inclusive); None if no rows match."""
+        days = self._days[:self._size]
+        mask = (
+            (self._types[:self._size] == TRANSACTION_TYPES.index(transaction_type))
+            & (days >= start_day)
+            & (days <= end_day)
+        )
+        if not mask.any():
+            return None
+        return float(self._prices[:self._size][mask].sum())
+
+    def top_selling_products(self, day: int, limit: int = 5) -> List[tuple]:
+        """The `limit` items with the highest sales revenue through `day`, as (item_name, units, revenue)."""
+        mask = self._through(day) & (self._types[:self._size] == TRANSACTION_TYPES.index("sales"))
+        # Shift codes by one so rows without an item get their own bucket
+        codes = self._items[:self._size][mask] + 1
+        buckets = len(self._item_names) + 1
+        units = np.bincount(codes, weights=self._units[:self._size][mask], minlength=buckets)
+        revenue = np.bincount(codes, weights=self._prices[:self._size][mask], minlength=buckets)
+
+        sold = np.unique(codes)
+        top = sold[np.argsort(-revenue[sold], kind="stable")[:limit]]
+        return [
+            (
+                self._item_name(code - 1),
+                None if code - 1 == NO_ITEM else int(units[code]),
+                float(revenue[code]),
+            )
+            for code in top
+        ]
+
+    def sales_since(self, after_id: int) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, int]:
+        """
+        Sales with an item whose ID is above `after_id`.
+
+        Returns:
+            Tuple: (item names, day numbers, units, IDs, highest ID in the ledger or `after_id`).
+        """
+        ids = self._ids[:self._size]
+        mask = (
+            (ids > after_id)
+            & (self._types[:self._size] == TRANSACTION_TYPES.index("sales"))
+            & (self._items[:self._size] != NO_ITEM)
+        )
+        item_names = [self._item_names[code] for code in self._items[:self._size][mask]]
+        watermark = max(int(after_id), int(ids.max())) if self._size else int(after_id)
+        return item_names, self._days[:self._size][mask], self._units[:self._size][mask], ids[mask], watermark
+
+    def last_day(self, item_names: List[str]) -> Optional[int]:
+        """The latest day of any row of some items, or None if they have no rows."""
+        codes = [self._item_codes[name] for name in item_names if name in self._item_codes]
+        mask = np.isin(self._items[:self._size], codes)
+        return int(self._days[:self._size][mask].max()) if mask.any() else None
+
+    def movements(self, item_names: List[str], start_day: int, end_day: int) -> List[tuple]:
+        """
+        Stock movements of some items between two days (inclusive).
+
+        Returns:
+            List[tuple]: One (item_name, day, inbound units, outbound units) tuple per row.
+        """
+        codes = [self._item_codes[name] for name in item_names if name in self._item_codes]
+        days = self._days[:self._size]
+        positions = np.flatnonzero(
+            np.isin(self._items[:self._size], codes) & (days >= start_day) & (days <= end_day)
+        )
+        is_stock_order = self._types[positions] == TRANSACTION_TYPES.index("stock_orders")
+        return [
+            (self._item_names[self._items[i]], int(days[i]), int(units) if inbound else 0, 0 if inbound else int(units))
+            for i, units, inbound in zip(positions, self._units[positions], is_stock_order)
+        ]
+
+    def _item_name(self, code: int) -> Optional[str]:
+        return None if code == NO_ITEM else self._item_names[code]
+
+    def _record(self, index: int) -> Dict:
+        """The row at array position `index` as a 'transactions' record."""
+        transaction_type = TRANSACTION_TYPES[self._types[index]]
+        return {
+            "id": int(self._ids[index]),
+            "item_name": self._item_name(int(self._items[index])),
+            "transaction_type": transaction_type,
+            "units": int(self._units[index]),
+            "price": float(self._prices[index]),
+            "transaction_date": self._dates[index],
+        }
+
+    def transaction(self, transaction_id: int, day: int) -> Optional[Dict]:
+        """The record with `transaction_id` if it is dated on or before `day`, else None."""
+        matches = np.flatnonzero((self._ids[:self._size] == transaction_id) & self._through(day))
+        return self._record(matches[0]) if matches.size else None
+
+    def recent_transactions(self, day: int, limit: int = 10) -> List[Dict]:
+        """The latest `limit` records through `day`, newest first."""
+        positions = np.flatnonzero(self._through(day))
+        order = np.lexsort((-self._ids[positions], -self._days[positions].astype(np.int64)))[:limit]
+        return [self._record(positions[i]) for i in order]
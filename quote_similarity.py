@@ -0,0 +1,272 @@
+"""
+Offline TF-IDF similarity search over the quote history.
+
+`QuoteSimilarityIndex` turns every historical quote (its customer request plus its quote
+explanation) into a sparse, L2-normalized TF-IDF vector over word unigrams and bigrams, and
+stacks them into one SciPy CSR matrix. A request is vectorized the same way, so the cosine
+similarity to every quote is a single sparse matrix-vector product. Words are folded with
+`catalog.normalize_name`, so case, punctuation and plurals do not matter.
+
+The index is saved to a `.npz` file next to the database and tagged with the 'quotes' table
+version it was built from (see `table_versions`), so a process can reuse it until quotes change.
+A new quote can be folded in with `add`, which weights its terms with the fitted IDF (a term
+the index has not seen gets the IDF of a term in one document); the IDF of the other quotes
+drifts from a fit a little with every quote added, so callers refit after enough of them.
+"""
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from catalog import normalize_name
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Words too common in requests and explanations to tell quotes apart
+STOP_WORDS = frozenset("""
+    a an and are as at be by for from have i in is it of on or our please the this to we with you your
+    would like need needs order ordering thank thanks
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into index terms: folded words without stop words, then adjacent word pairs.
+
+    Args:
+        text (str): A request or quote explanation.
+
+    Returns:
+        List[str]: Unigram terms followed by bigram terms ('word other').
+    """
+    words = [normalize_name(word) for word in _WORD.findall(str(text or "").lower())]
+    words = [word for word in words if len(word) > 1 and word not in STOP_WORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class QuoteSimilarityIndex:
+    """Sparse TF-IDF vectors of the quote history with metadata filters."""
+
+    def __init__(
+        self,
+        terms: Sequence[str],
+        idf: np.ndarray,
+        matrix: sparse.csr_matrix,
+        quote_ids: np.ndarray,
+        job_types: np.ndarray,
+        order_sizes: np.ndarray,
+        event_types: np.ndarray,
+        version: int,
+        added: int = 0,
+    ):
+        self.terms = np.asarray(terms, dtype=str)
+        self.vocabulary: Dict[str, int] = {term: column for column, term in enumerate(self.terms)}
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.matrix = sparse.csr_matrix(matrix)
+        self.quote_ids = np.asarray(quote_ids, dtype=np.int64)
+        self.job_types = np.asarray(job_types, dtype=str)
+        self.order_sizes = np.asarray(order_sizes, dtype=str)
+        self.event_types = np.asarray(event_types, dtype=str)
+        self.version = int(version)
+        self.added = int(added)         # quotes folded in with `add` since the fit
+
+    def __len__(self) -> int:
+        return int(self.quote_ids.size)
+
+    @classmethod
+    def fit(cls, rows: Sequence[tuple], version: int) -> "QuoteSimilarityIndex":
+        """
+        Build the index.
+
+        Args:
+            rows (Sequence[tuple]): (quote_id, request_text, quote_explanation, job_type,
+                                    order_size, event_type) per quote.
+            version (int): The 'quotes' table version the rows were read at.
+
+        Returns:
+            QuoteSimilarityIndex: The fitted index.
+        """
+        counts = [Counter(tokenize(f"{row[1]} {row[2]}")) for row in rows]
+        document_frequency = Counter(term for count in counts for term in count)
+        terms = sorted(document_frequency)
+        vocabulary = {term: column for column, term in enumerate(terms)}
+
+        # Smoothed inverse document frequency, as if one extra document held every term
+        documents = len(rows)
+        idf = np.array(
+            [math.log((1 + documents) / (1 + document_frequency[term])) + 1 for term in terms], dtype=np.float64
+        )
+
+        indptr, indices, data = [0], [], []
+        for count in counts:
+            indices.extend(vocabulary[term] for term in count)
+            data.extend(1 + math.log(frequency) for frequency in count.values())
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(documents, len(terms)),
+        )
+        matrix = _normalize_rows(matrix @ sparse.diags(idf))
+
+        return cls(
+            terms,
+            idf,
+            matrix,
+            np.array([row[0] for row in rows], dtype=np.int64),
+            np.array([row[3] or "" for row in rows], dtype=str),
+            np.array([row[4] or "" for row in rows], dtype=str),
+            np.array([row[5] or "" for row in rows], dtype=str),
+            version,
+        )
+
+    def add(
+        self,
+        quote_id: int,
+        request_text: str,
+        quote_explanation: str,
+        job_type: str,
+        order_size: str,
+        event_type: str,
+        version: int,
+    ) -> "QuoteSimilarityIndex":
+        """
+        A copy of the index with one more quote, weighted with the fitted IDF; terms new to the
+        index are added as columns with the IDF of a term only this quote holds.
+
+        Args:
+            quote_id (int): The quote's rowid.
+            request_text (str): The customer request.
+            quote_explanation (str): The quote explanation.
+            job_type (str): The customer's job.
+            order_size (str): The order size.
+            event_type (str): The event.
+            version (int): The 'quotes' table version with the quote stored.
+
+        Returns:
+            QuoteSimilarityIndex: The extended index; this one is left unchanged.
+        """
+        text = f"{request_text} {quote_explanation}"
+        new_terms = sorted({term for term in tokenize(text) if term not in self.vocabulary})
+        documents = len(self) + 1
+        terms = np.append(self.terms, new_terms)
+        idf = np.append(self.idf, np.full(len(new_terms), math.log((1 + documents) / 2) + 1))
+        matrix = sparse.csr_matrix(
+            (self.matrix.data, self.matrix.indices, self.matrix.indptr), shape=(len(self), len(terms))
+        )
+        vocabulary = {**self.vocabulary, **{term: len(self.terms) + offset for offset, term in enumerate(new_terms)}}
+        return QuoteSimilarityIndex(
+            terms,
+            idf,
+            sparse.vstack([matrix, _tfidf_vector(text, vocabulary, idf)], format="csr"),
+            np.append(self.quote_ids, quote_id),
+            np.append(self.job_types, job_type or ""),
+            np.append(self.order_sizes, order_size or ""),
+            np.append(self.event_types, event_type or ""),
+            version,
+            self.added + 1,
+        )
+
+    def vectorize(self, text: str) -> sparse.csr_matrix:
+        """The normalized TF-IDF row vector of `text`; terms not in the index are ignored."""
+        return _tfidf_vector(text, self.vocabulary, self.idf)
+
+    def query(
+        self,
+        text: str,
+        k: int = 5,
+        job_type: Optional[str] = None,
+        order_size: Optional[str] = None,
+        event_type: Optional[str] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Find the quotes most similar to `text`.
+
+        Args:
+            text (str): The request to compare.
+            k (int, optional): Number of quotes to return. Default is 5.
+            job_type (str, optional): Only quotes for this job type (case-insensitive).
+            order_size (str, optional): Only quotes of this order size (case-insensitive).
+            event_type (str, optional): Only quotes for this event type (case-insensitive).
+
+        Returns:
+            List[Tuple[int, float]]: (quote_id, cosine similarity) pairs, most similar first.
+                                     Quotes sharing no term with `text` are left out.
+        """
+        if k <= 0 or len(self) == 0:
+            return []
+        scores = (self.matrix @ self.vectorize(text).T).toarray().ravel()
+
+        keep = scores > 0
+        for values, wanted in ((self.job_types, job_type), (self.order_sizes, order_size), (self.event_types, event_type)):
+            if wanted:
+                keep &= np.char.lower(values) == wanted.strip().lower()
+        candidates = np.flatnonzero(keep)
+        if candidates.size > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        # Best first; ties keep the newest quote first
+        order = np.lexsort((-self.quote_ids[candidates], -scores[candidates]))
+        return [(int(self.quote_ids[index]), float(scores[index])) for index in candidates[order]]
+
+    def save(self, path: str) -> None:
+        """Write the index to a `.npz` file, replacing any previous one atomically."""
+        temporary = f"{path}.tmp.npz"
+        np.savez_compressed(
+            temporary,
+            terms=self.terms,
+            idf=self.idf,
+            data=self.matrix.data,
+            indices=self.matrix.indices,
+            indptr=self.matrix.indptr,
+            shape=np.array(self.matrix.shape),
+            quote_ids=self.quote_ids,
+            job_types=self.job_types,
+            order_sizes=self.order_sizes,
+            event_types=self.event_types,
+            version=np.array(self.version),
+        )
+        os.replace(temporary, path)
+
+    @staticmethod
+    def saved_version(path: str) -> int:
+        """The 'quotes' version of an index written by `save`, read without loading its arrays."""
+        with np.load(path, allow_pickle=False) as stored:
+            return int(stored["version"])
+
+    @classmethod
+    def load(cls, path: str) -> "QuoteSimilarityIndex":
+        """Read an index written by `save`."""
+        with np.load(path, allow_pickle=False) as stored:
+            matrix = sparse.csr_matrix(
+                (stored["data"], stored["indices"], stored["indptr"]), shape=tuple(stored["shape"])
+            )
+            return cls(
+                stored["terms"],
+                stored["idf"],
+                matrix,
+                stored["quote_ids"],
+                stored["job_types"],
+                stored["order_sizes"],
+                stored["event_types"],
+                int(stored["version"]),
+            )
+
+
+def _tfidf_vector(text: str, vocabulary: Dict[str, int], idf: np.ndarray) -> sparse.csr_matrix:
+    """The normalized TF-IDF row vector of `text` over `vocabulary`; other terms are ignored."""
+    count = Counter(term for term in tokenize(text) if term in vocabulary)
+    columns = np.array([vocabulary[term] for term in count], dtype=np.int32)
+    weights = np.array([1 + math.log(frequency) for frequency in count.values()], dtype=np.float64)
+    vector = sparse.csr_matrix((weights * idf[columns], columns, np.array([0, columns.size])), shape=(1, idf.size))
+    return _normalize_rows(vector)
+
+
+def _normalize_rows(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    """Scale every non-empty row of a sparse matrix to unit L2 norm."""
+    matrix = sparse.csr_matrix(matrix)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
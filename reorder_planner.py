@@ -0,0 +1,185 @@
+"""
+Demand-driven reorder points and order-up-to levels.
+
+`ReorderPlanner` keeps every sale it has been shown as NumPy arrays of (item code, day, units)
+and is refreshed incrementally: callers pass only the sales recorded since its watermark (the
+highest ledger ID folded in so far). When asked for a plan it bins the sales of the trailing
+`window_days` into an items × days demand matrix and measures demand with rolling windows
+over that matrix:
+
+- the demand over the supplier lead time (the tiers of `get_supplier_delivery_date`) gives
+  the reorder point, as its mean plus `safety_factor` standard deviations;
+- the demand over the lead time plus one review period gives the order-up-to level.
+
+Reorder points never fall below an item's `min_stock_level`, and the order-up-to level is
+always at least `min_order_quantity` above the reorder point, so items without sales history
+still get sensible restocks.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass
+class ReorderPlan:
+    """Per-item planning figures, aligned with the item names the plan was asked for."""
+    demand_rate: np.ndarray      # mean units sold per day over the window
+    demand_std: np.ndarray       # standard deviation of the daily units sold
+    lead_days: np.ndarray        # supplier lead time of a typical restock
+    reorder_point: np.ndarray    # restock when stock falls below this level
+    order_up_to: np.ndarray      # restock back up to this level
+
+
+class ReorderPlanner:
+    """Incrementally refreshed sales history with vectorized reorder-point planning."""
+
+    def __init__(
+        self,
+        window_days: int = 28,
+        review_days: int = 7,
+        safety_factor: float = 1.65,
+        min_order_quantity: int = 50,
+    ):
+        """
+        Args:
+            window_days (int, optional): Days of sales history used to estimate demand. Default is 28.
+            review_days (int, optional): Days of demand a restock should cover beyond the lead time.
+                                         Default is 7.
+            safety_factor (float, optional): Standard deviations of safety stock (1.65 ≈ 95% service).
+            min_order_quantity (int, optional): Smallest gap between the reorder point and the
+                                                order-up-to level. Default is 50.
+        """
+        self.window_days = int(window_days)
+        self.review_days = int(review_days)
+        self.safety_factor = float(safety_factor)
+        self.min_order_quantity = int(min_order_quantity)
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        """Forget every sale, e.g. after the database is re-initialized."""
+        with self._lock:
+            self.watermark = 0
+            self._item_codes: Dict[str, int] = {}
+            self._items = np.zeros(0, dtype=np.int32)
+            self._days = np.zeros(0, dtype=np.int32)
+            self._units = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return int(self._units.size)
+
+    def observe(
+        self,
+        item_names: Sequence[str],
+        days: Sequence[int],
+        units: Sequence[int],
+        ids: Sequence[int],
+        watermark: Optional[int] = None,
+    ) -> None:
+        """
+        Fold in sales recorded after the current watermark.
+
+        Sales at or below the watermark are skipped, so concurrent refreshes that read
+        overlapping rows do not count a sale twice.
+
+        Args:
+            item_names (Sequence[str]): Item of each sale.
+            days (Sequence[int]): Day number of each sale (see `repository.to_day_number`).
+            units (Sequence[int]): Units of each sale.
+            ids (Sequence[int]): Ledger ID of each sale.
+            watermark (int, optional): The highest ledger ID covered by these sales, if the
+                                       caller read past the last one. Default is the highest of `ids`.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if watermark is None:
+            watermark = int(ids.max()) if ids.size else 0
+        with self._lock:
+            new = np.flatnonzero(ids > self.watermark)
+            if new.size:
+                codes = np.array(
+                    [self._item_codes.setdefault(item_names[i], len(self._item_codes)) for i in new], dtype=np.int32
+                )
+                self._items = np.concatenate([self._items, codes])
+                self._days = np.concatenate([self._days, np.asarray(days, dtype=np.int32)[new]])
+                self._units = np.concatenate([self._units, np.asarray(units, dtype=np.int64)[new]])
+            self.watermark = max(self.watermark, int(watermark))
+
+    def daily_demand(self, item_names: Sequence[str], day: int) -> np.ndarray:
+        """
+        Units sold per item and day over the `window_days` ending at `day` (inclusive).
+
+        Returns:
+            np.ndarray: An (items × window_days) matrix, oldest day first.
+        """
+        with self._lock:
+            item_codes, items, days, units = dict(self._item_codes), self._items, self._days, self._units
+
+        demand = np.zeros((len(item_names), self.window_days), dtype=np.int64)
+        # Row of each known item code in the result, -1 for items not asked for
+        rows = np.full(len(item_codes) + 1, -1, dtype=np.int64)
+        for row, name in enumerate(item_names):
+            code = item_codes.get(name)
+            if code is not None:
+                rows[code] = row
+
+        offsets = days - (day - self.window_days + 1)
+        mask = (offsets >= 0) & (offsets < self.window_days) & (rows[items] >= 0)
+        np.add.at(demand, (rows[items[mask]], offsets[mask]), units[mask])
+        return demand
+
+    def _rolling_demand(self, demand: np.ndarray, length: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Mean and standard deviation per item of the demand summed over every `length`-day window."""
+        length = min(max(int(length), 1), self.window_days)
+        cumulative = np.concatenate([np.zeros((demand.shape[0], 1), dtype=np.int64), demand.cumsum(axis=1)], axis=1)
+        sums = cumulative[:, length:] - cumulative[:, :-length]
+        return sums.mean(axis=1), sums.std(axis=1)
+
+    def plan(
+        self,
+        item_names: Sequence[str],
+        min_stock_levels: Sequence[int],
+        day: int,
+        lead_days: Callable[[np.ndarray], np.ndarray],
+    ) -> ReorderPlan:
+        """
+        Compute reorder points and order-up-to levels as of `day`.
+
+        Args:
+            item_names (Sequence[str]): Items to plan.
+            min_stock_levels (Sequence[int]): Minimum stock level of each item (a floor for the reorder point).
+            day (int): The planning day; only sales on or before it count.
+            lead_days (Callable): Maps an array of order quantities to supplier lead days.
+
+        Returns:
+            ReorderPlan: Figures aligned with `item_names`.
+        """
+        demand = self.daily_demand(item_names, day)
+        demand_rate = demand.mean(axis=1)
+        demand_std = demand.std(axis=1)
+        min_stock_levels = np.asarray(min_stock_levels, dtype=np.int64)
+
+        # A typical restock covers one review period of demand, and its size sets the lead time tier
+        typical_order = np.maximum(np.ceil(demand_rate * self.review_days), self.min_order_quantity)
+        lead = np.asarray(lead_days(typical_order.astype(np.int64)), dtype=np.int64)
+
+        reorder_point = np.zeros(len(item_names))
+        order_up_to = np.zeros(len(item_names))
+        # One pass of rolling windows per lead time tier present
+        for tier in np.unique(lead):
+            in_tier = lead == tier
+            mean, std = self._rolling_demand(demand[in_tier], tier)
+            reorder_point[in_tier] = mean + self.safety_factor * std
+            mean, std = self._rolling_demand(demand[in_tier], tier + self.review_days)
+            order_up_to[in_tier] = mean + self.safety_factor * std
+
+        reorder_point = np.maximum(np.ceil(reorder_point).astype(np.int64), min_stock_levels)
+        order_up_to = np.maximum(np.ceil(order_up_to).astype(np.int64), reorder_point + self.min_order_quantity)
+        return ReorderPlan(
+            demand_rate=demand_rate,
+            demand_std=demand_std,
+            lead_days=lead,
+            reorder_point=reorder_point,
+            order_up_to=order_up_to,
+        )
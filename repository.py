@@ -0,0 +1,872 @@
+"""
+Query layer for the Munder Difflin database.
+
+Every ledger, inventory and quote query the tools run lives here as a named, parameterized
+statement. The statement texts are constants, so SQLite's per-connection prepared-statement
+cache is hit on every call instead of compiling a new statement per item or date, and values
+are always bound as parameters rather than formatted into the SQL.
+
+Statements are executed straight on the DBAPI cursor (`exec_driver_sql`), and every execution
+is counted per statement name; see `statement_counts`.
+
+Ledger dates are filtered on 'transactions.transaction_day', the proleptic Gregorian ordinal of
+the transaction date (`date.toordinal()`), so a date is in range or not regardless of whether
+it was written as '2025-01-01' or '2025-01-01T00:00:00'. Convert every date with
+`to_day_number` before binding it.
+"""
+import threading
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Union
+
+import pandas as pd
+
+# Net stock movement of a ledger row: stock orders add units, sales remove them
+_SIGNED_UNITS = """CASE
+                    WHEN transaction_type = 'stock_orders' THEN units
+                    WHEN transaction_type = 'sales' THEN -units
+                    ELSE 0
+                END"""
+
+# Net cash movement of a ledger row: sales bring cash in, stock orders pay it out
+_SIGNED_CASH = """CASE
+                    WHEN transaction_type = 'sales' THEN price
+                    WHEN transaction_type = 'stock_orders' THEN -price
+                    ELSE 0
+                END"""
+
+# Units of one item (:item_name, or the correlated s.item_name) moved to the columnar archive in
+# months that end on or before :day, plus the archived rows of the month containing :day
+# (:partial_units, a JSON object of item name -> units; see `ledger_archive.partial_month`).
+_ARCHIVED_UNITS = """COALESCE((
+                SELECT SUM(m.units) FROM ledger_archive_manifest m
+                WHERE m.item_name = {item}
+                AND m.month_end_day <= :day
+            ), 0) + COALESCE((
+                SELECT p.value FROM json_each(:partial_units) p
+                WHERE p.key = {item}
+            ), 0)"""
+
+# (item_name, stock) for every ledger item at the end of day :day. Items with no ledger row
+# after that day come from the 'stock_levels' projection; the rest read the latest checkpoint
+# of the live ledger before :day, add only that day's rows and add their archived units.
+_STOCK_AS_OF = f"""
+        SELECT item_name, units AS stock
+        FROM stock_levels
+        WHERE last_transaction_day <= :day
+        UNION ALL
+        SELECT
+            s.item_name,
+            COALESCE((
+                SELECT c.units FROM stock_checkpoints c
+                WHERE c.item_name = s.item_name
+                AND c.checkpoint_day < :day
+                ORDER BY c.checkpoint_day DESC
+                LIMIT 1
+            ), 0) + COALESCE(d.delta, 0) + {_ARCHIVED_UNITS.format(item="s.item_name")} AS stock
+        FROM stock_levels s
+        LEFT JOIN (
+            SELECT item_name, SUM({_SIGNED_UNITS}) AS delta
+            FROM transactions
+            WHERE transaction_day = :day
+            GROUP BY item_name
+        ) d ON d.item_name = s.item_name
+        WHERE s.last_transaction_day > :day
+"""
+
+_INVENTORY_VALUATION = """
+        SELECT
+            i.item_name,
+            COALESCE(s.stock, 0) AS stock,
+            i.unit_price,
+            COALESCE(s.stock, 0) * i.unit_price AS value
+        FROM inventory i
+        LEFT JOIN ({stock}) s ON s.item_name = i.item_name
+"""
+
+_INVENTORY_STATUS = """
+        SELECT
+            i.item_name,
+            i.category,
+            i.unit_price,
+            i.min_stock_level,
+            CASE WHEN s.stock > 0 THEN s.stock ELSE 0 END AS current_stock
+        FROM inventory i
+        LEFT JOIN ({stock}) s ON s.item_name = i.item_name
+"""
+
+STATEMENTS: Dict[str, str] = {
+    # ------------------------------------------------------------------
+    # Schema
+    # ------------------------------------------------------------------
+    "schema.drop_transactions": "DROP TABLE IF EXISTS transactions",
+    "schema.create_transactions": """
+        CREATE TABLE IF NOT EXISTS transactions
+        (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_name TEXT,
+            transaction_type TEXT,
+            units INTEGER,
+            price REAL,
+            transaction_date TEXT,
+            transaction_day INTEGER
+        )
+    """,
+    "schema.transactions_columns": "SELECT name FROM pragma_table_info('transactions')",
+    "schema.add_transaction_day": "ALTER TABLE transactions ADD COLUMN transaction_day INTEGER",
+    # julianday('0001-01-01') is 1721425.5 and date(1, 1, 1).toordinal() is 1
+    "schema.backfill_transaction_day": """
+        UPDATE transactions
+        SET transaction_day = CAST(julianday(substr(transaction_date, 1, 10)) - 1721424.5 AS INTEGER)
+        WHERE transaction_day IS NULL
+    """,
+    "schema.drop_index_transactions_item_date": "DROP INDEX IF EXISTS idx_transactions_item_date",
+    "schema.drop_index_transactions_date": "DROP INDEX IF EXISTS idx_transactions_date",
+    "schema.drop_index_transactions_type_date": "DROP INDEX IF EXISTS idx_transactions_type_date",
+    "schema.index_transactions_item_day":
+        "CREATE INDEX IF NOT EXISTS idx_transactions_item_day ON transactions (item_name, transaction_day)",
+    "schema.index_transactions_day":
+        "CREATE INDEX IF NOT EXISTS idx_transactions_day ON transactions (transaction_day)",
+    "schema.index_transactions_type_day":
+        "CREATE INDEX IF NOT EXISTS idx_transactions_type_day ON transactions (transaction_type, transaction_day)",
+    "schema.index_inventory_item":
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_item ON inventory (item_name)",
+    "schema.index_quote_requests_id":
+        "CREATE INDEX IF NOT EXISTS idx_quote_requests_id ON quote_requests (id)",
+    "schema.index_quotes_request_id":
+        "CREATE INDEX IF NOT EXISTS idx_quotes_request_id ON quotes (request_id)",
+    "schema.drop_stock_levels": "DROP TABLE IF EXISTS stock_levels",
+    "schema.create_stock_levels": """
+        CREATE TABLE stock_levels
+        (
+            item_name TEXT PRIMARY KEY,
+            units INTEGER NOT NULL DEFAULT 0,
+            last_transaction_day INTEGER
+        )
+    """,
+    "schema.drop_stock_checkpoints": "DROP TABLE IF EXISTS stock_checkpoints",
+    "schema.create_stock_checkpoints": """
+        CREATE TABLE stock_checkpoints
+        (
+            item_name TEXT NOT NULL,
+            checkpoint_day INTEGER NOT NULL,
+            units INTEGER NOT NULL,
+            PRIMARY KEY (item_name, checkpoint_day)
+        )
+    """,
+    "schema.index_stock_checkpoints_day":
+        "CREATE INDEX IF NOT EXISTS idx_stock_checkpoints_day ON stock_checkpoints (checkpoint_day)",
+    "schema.drop_cash_checkpoints": "DROP TABLE IF EXISTS cash_checkpoints",
+    "schema.create_archive_partitions": """
+        CREATE TABLE IF NOT EXISTS ledger_archive_partitions
+        (
+            path TEXT PRIMARY KEY,
+            month_start_day INTEGER NOT NULL,
+            month_end_day INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            min_id INTEGER NOT NULL,
+            max_id INTEGER NOT NULL
+        )
+    """,
+    "schema.create_archive_manifest": """
+        CREATE TABLE IF NOT EXISTS ledger_archive_manifest
+        (
+            path TEXT NOT NULL,
+            month_start_day INTEGER NOT NULL,
+            month_end_day INTEGER NOT NULL,
+            item_name TEXT,
+            units INTEGER NOT NULL,
+            cash REAL NOT NULL,
+            sales_units INTEGER NOT NULL,
+            sales_revenue REAL NOT NULL,
+            stock_order_cost REAL NOT NULL,
+            last_day INTEGER NOT NULL
+        )
+    """,
+    "schema.index_archive_manifest_item_month":
+        "CREATE INDEX IF NOT EXISTS idx_archive_manifest_item_month ON ledger_archive_manifest (item_name, month_end_day)",
+    "schema.index_archive_manifest_month":
+        "CREATE INDEX IF NOT EXISTS idx_archive_manifest_month ON ledger_archive_manifest (month_end_day)",
+    "schema.drop_archive_partitions": "DROP TABLE IF EXISTS ledger_archive_partitions",
+    "schema.drop_archive_manifest": "DROP TABLE IF EXISTS ledger_archive_manifest",
+    "schema.create_table_versions": """
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    """,
+    "schema.bump_inventory_version": """
+        INSERT INTO table_versions (table_name, version) VALUES ('inventory', 1)
+        ON CONFLICT(table_name) DO UPDATE SET version = version + 1
+    """,
+    # Any change to 'inventory' bumps its version, so cached reference rows know to reload
+    "schema.inventory_insert_trigger": """
+        CREATE TRIGGER IF NOT EXISTS inventory_version_insert AFTER INSERT ON inventory
+        BEGIN UPDATE table_versions SET version = version + 1 WHERE table_name = 'inventory'; END
+    """,
+    "schema.inventory_update_trigger": """
+        CREATE TRIGGER IF NOT EXISTS inventory_version_update AFTER UPDATE ON inventory
+        BEGIN UPDATE table_versions SET version = version + 1 WHERE table_name = 'inventory'; END
+    """,
+    "schema.inventory_delete_trigger": """
+        CREATE TRIGGER IF NOT EXISTS inventory_version_delete AFTER DELETE ON inventory
+        BEGIN UPDATE table_versions SET version = version + 1 WHERE table_name = 'inventory'; END
+    """,
+    "schema.create_pending_restocks": """
+        CREATE TABLE IF NOT EXISTS pending_restocks
+        (
+            item_name TEXT PRIMARY KEY,
+            reason TEXT NOT NULL,
+            units INTEGER NOT NULL,
+            min_stock_level INTEGER NOT NULL,
+            queued_day INTEGER NOT NULL
+        )
+    """,
+    "schema.drop_pending_restocks": "DROP TABLE IF EXISTS pending_restocks",
+    "schema.drop_backorders": "DROP TABLE IF EXISTS backorders",
+    "schema.create_backorders": """
+        CREATE TABLE IF NOT EXISTS backorders
+        (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            price REAL NOT NULL,
+            order_date TEXT NOT NULL,
+            due_day INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open',
+            filled_day INTEGER,
+            transaction_id INTEGER
+        )
+    """,
+    "schema.index_backorders_open":
+        "CREATE INDEX IF NOT EXISTS idx_backorders_open ON backorders (status, item_name, due_day)",
+    # Full-text index of quote history: the customer request and the quote explanation of every
+    # quote, keyed by the quote's rowid, with porter stemming
+    "schema.drop_quotes_fts": "DROP TABLE IF EXISTS quotes_fts",
+    "schema.create_quotes_fts": """
+        CREATE VIRTUAL TABLE quotes_fts USING fts5(
+            request_text,
+            quote_explanation,
+            tokenize = 'porter unicode61'
+        )
+    """,
+    "schema.rebuild_quotes_fts": """
+        INSERT INTO quotes_fts (rowid, request_text, quote_explanation)
+        SELECT q.rowid, COALESCE(qr.response, ''), COALESCE(q.quote_explanation, '')
+        FROM quotes q
+        LEFT JOIN quote_requests qr ON qr.id = q.request_id
+    """,
+    # Quotes stored later are indexed as they are written
+    "schema.quotes_fts_insert_trigger": """
+        CREATE TRIGGER IF NOT EXISTS quotes_fts_insert AFTER INSERT ON quotes
+        BEGIN
+            INSERT INTO quotes_fts (rowid, request_text, quote_explanation)
+            VALUES (
+                new.rowid,
+                COALESCE((SELECT response FROM quote_requests WHERE id = new.request_id), ''),
+                COALESCE(new.quote_explanation, '')
+            );
+        END
+    """,
+    "schema.quotes_fts_update_trigger": """
+        CREATE TRIGGER IF NOT EXISTS quotes_fts_update AFTER UPDATE OF request_id, quote_explanation ON quotes
+        BEGIN
+            DELETE FROM quotes_fts WHERE rowid = old.rowid;
+            INSERT INTO quotes_fts (rowid, request_text, quote_explanation)
+            VALUES (
+                new.rowid,
+                COALESCE((SELECT response FROM quote_requests WHERE id = new.request_id), ''),
+                COALESCE(new.quote_explanation, '')
+            );
+        END
+    """,
+    "schema.quotes_fts_delete_trigger": """
+        CREATE TRIGGER IF NOT EXISTS quotes_fts_delete AFTER DELETE ON quotes
+        BEGIN DELETE FROM quotes_fts WHERE rowid = old.rowid; END
+    """,
+    # Any change to 'quotes' bumps its version, so a saved similarity index knows it is stale
+    "schema.bump_quotes_version": """
+        INSERT INTO table_versions (table_name, version) VALUES ('quotes', 1)
+        ON CONFLICT(table_name) DO UPDATE SET version = version + 1
+    """,
+    "schema.quotes_insert_trigger": """
+        CREATE TRIGGER IF NOT EXISTS quotes_version_insert AFTER INSERT ON quotes
+        BEGIN UPDATE table_versions SET version = version + 1 WHERE table_name = 'quotes'; END
+    """,
+    "schema.quotes_update_trigger": """
+        CREATE TRIGGER IF NOT EXISTS quotes_version_update AFTER UPDATE ON quotes
+        BEGIN UPDATE table_versions SET version = version + 1 WHERE table_name = 'quotes'; END
+    """,
+    "schema.quotes_delete_trigger": """
+        CREATE TRIGGER IF NOT EXISTS quotes_version_delete AFTER DELETE ON quotes
+        BEGIN UPDATE table_versions SET version = version + 1 WHERE table_name = 'quotes'; END
+    """,
+    # Discount percentage per (job_type, order_size, event_type) cell, fitted from 'quotes' at
+    # version quotes_version; '*' in a key column matches any value
+    "schema.create_discount_policy": """
+        CREATE TABLE IF NOT EXISTS discount_policy (
+            job_type TEXT NOT NULL,
+            order_size TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            discount_percentage REAL NOT NULL,
+            quotes INTEGER NOT NULL,
+            quotes_version INTEGER NOT NULL,
+            PRIMARY KEY (job_type, order_size, event_type)
+        )
+    """,
+    "schema.discount_policy_exists":
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'discount_policy'",
+    "schema.create_cash_checkpoints": """
+        CREATE TABLE cash_checkpoints
+        (
+            checkpoint_day INTEGER PRIMARY KEY,
+            cash REAL NOT NULL
+        )
+    """,
+
+    # ------------------------------------------------------------------
+    # Ledger writes and derived tables
+    # ------------------------------------------------------------------
+    "ledger.insert": """
+        INSERT INTO transactions (item_name, transaction_type, units, price, transaction_date, transaction_day)
+        VALUES (:item_name, :transaction_type, :units, :price, :transaction_date, :transaction_day)
+    """,
+    "ledger.last_insert_id": "SELECT last_insert_rowid()",
+    # Bumped once per committed ledger write, so tool contexts can tell their cached stock is stale
+    "ledger.bump_version": """
+        INSERT INTO table_versions (table_name, version) VALUES ('transactions', 1)
+        ON CONFLICT(table_name) DO UPDATE SET version = version + 1
+    """,
+    "ledger.version": "SELECT version FROM table_versions WHERE table_name = 'transactions'",
+    "stock_levels.rebuild": f"""
+        INSERT INTO stock_levels (item_name, units, last_transaction_day)
+        SELECT item_name, SUM(units), MAX(last_day)
+        FROM (
+            SELECT item_name, COALESCE(SUM({_SIGNED_UNITS}), 0) AS units, MAX(transaction_day) AS last_day
+            FROM transactions
+            WHERE item_name IS NOT NULL
+            GROUP BY item_name
+            UNION ALL
+            SELECT item_name, units, last_day
+            FROM ledger_archive_manifest
+            WHERE item_name IS NOT NULL
+        )
+        GROUP BY item_name
+    """,
+    "stock_levels.apply_delta": """
+        INSERT INTO stock_levels (item_name, units, last_transaction_day)
+        VALUES (:item_name, :units_delta, :transaction_day)
+        ON CONFLICT(item_name) DO UPDATE SET
+            units = units + excluded.units,
+            last_transaction_day = MAX(COALESCE(last_transaction_day, 0), excluded.last_transaction_day)
+    """,
+    # Latest booked day over some items (:item_names is a JSON array)
+    "stock_levels.last_day_of_items": """
+        SELECT MAX(last_transaction_day) FROM stock_levels
+        WHERE item_name IN (SELECT value FROM json_each(:item_names))
+    """,
+    # Net stock of some items (:item_names is a JSON array), before a write applies its deltas
+    "stock_levels.units_of_items": """
+        SELECT item_name, units FROM stock_levels
+        WHERE item_name IN (SELECT value FROM json_each(:item_names))
+    """,
+    # Takes the write lock up front, so stock read inside the transaction cannot be claimed by
+    # another writer before it commits
+    "transaction.begin_immediate": "BEGIN IMMEDIATE",
+    # A read transaction: in WAL mode every read inside it sees the same snapshot
+    "transaction.begin": "BEGIN",
+    "transaction.commit": "COMMIT",
+    "transaction.rollback": "ROLLBACK",
+    "checkpoints.clear_stock": "DELETE FROM stock_checkpoints",
+    "checkpoints.clear_cash": "DELETE FROM cash_checkpoints",
+    "checkpoints.invalidate_stock": "DELETE FROM stock_checkpoints WHERE checkpoint_day >= :day",
+    "checkpoints.invalidate_cash": "DELETE FROM cash_checkpoints WHERE checkpoint_day >= :day",
+    "checkpoints.watermark": "SELECT MAX(checkpoint_day) FROM cash_checkpoints",
+    # Extending is idempotent: checkpoints another connection already wrote are kept
+    "checkpoints.extend_stock": f"""
+        INSERT OR IGNORE INTO stock_checkpoints (item_name, checkpoint_day, units)
+        SELECT
+            d.item_name,
+            d.day,
+            COALESCE((
+                SELECT c.units FROM stock_checkpoints c
+                WHERE c.item_name = d.item_name
+                ORDER BY c.checkpoint_day DESC
+                LIMIT 1
+            ), 0) + SUM(d.delta) OVER (PARTITION BY d.item_name ORDER BY d.day)
+        FROM (
+            SELECT item_name, transaction_day AS day, SUM({_SIGNED_UNITS}) AS delta
+            FROM transactions
+            WHERE item_name IS NOT NULL
+            AND transaction_day BETWEEN :start AND :through_day
+            GROUP BY item_name, day
+        ) d
+    """,
+    "checkpoints.extend_cash": f"""
+        INSERT OR IGNORE INTO cash_checkpoints (checkpoint_day, cash)
+        SELECT
+            d.day,
+            COALESCE((
+                SELECT c.cash FROM cash_checkpoints c
+                WHERE c.checkpoint_day = (SELECT MAX(checkpoint_day) FROM cash_checkpoints)
+            ), 0) + SUM(d.delta) OVER (ORDER BY d.day)
+        FROM (
+            SELECT transaction_day AS day, SUM({_SIGNED_CASH}) AS delta
+            FROM transactions
+            WHERE transaction_day BETWEEN :start AND :through_day
+            GROUP BY day
+        ) d
+    """,
+    "checkpoints.mark_watermark": """
+        INSERT OR IGNORE INTO cash_checkpoints (checkpoint_day, cash)
+        SELECT :through_day, COALESCE((
+            SELECT cash FROM cash_checkpoints
+            WHERE checkpoint_day = (SELECT MAX(checkpoint_day) FROM cash_checkpoints)
+        ), 0)
+    """,
+
+    # ------------------------------------------------------------------
+    # Stock and cash as of the end of a day
+    # ------------------------------------------------------------------
+    "stock.projected_item": """
+        SELECT item_name, units AS current_stock
+        FROM stock_levels
+        WHERE item_name = :item_name
+        AND last_transaction_day <= :day
+    """,
+    "stock.item_as_of": f"""
+        SELECT
+            :item_name AS item_name,
+            COALESCE((
+                SELECT units FROM stock_checkpoints
+                WHERE item_name = :item_name
+                AND checkpoint_day < :day
+                ORDER BY checkpoint_day DESC
+                LIMIT 1
+            ), 0) + COALESCE((
+                SELECT SUM({_SIGNED_UNITS})
+                FROM transactions
+                WHERE item_name = :item_name
+                AND transaction_day = :day
+            ), 0) + {_ARCHIVED_UNITS.format(item=":item_name")} AS current_stock
+    """,
+    # :item_names is a JSON array; every name gets a row, with stock 0 if it is not in the ledger
+    # and a NULL minimum if it is not in the inventory table
+    "stock.items_with_minimum": f"""
+        SELECT n.value AS item_name, COALESCE(s.stock, 0) AS stock, i.min_stock_level
+        FROM json_each(:item_names) n
+        LEFT JOIN ({_STOCK_AS_OF}) s ON s.item_name = n.value
+        LEFT JOIN inventory i ON i.item_name = n.value
+    """,
+    # Opening stock at the end of :day (one row per name in the JSON array :item_names, with
+    # NULL day columns), then the stock orders and sales of each later day through :end_day
+    "stock.timeline": f"""
+        SELECT n.value AS item_name, NULL AS transaction_day, COALESCE(s.stock, 0) AS opening,
+               0 AS inbound, 0 AS outbound
+        FROM json_each(:item_names) n
+        LEFT JOIN ({_STOCK_AS_OF}) s ON s.item_name = n.value
+        UNION ALL
+        SELECT item_name, transaction_day, 0,
+               SUM(CASE WHEN transaction_type = 'stock_orders' THEN units ELSE 0 END),
+               SUM(CASE WHEN transaction_type = 'sales' THEN units ELSE 0 END)
+        FROM transactions
+        WHERE item_name IN (SELECT value FROM json_each(:item_names))
+          AND transaction_day > :day AND transaction_day <= :end_day
+        GROUP BY item_name, transaction_day
+    """,
+    "stock.positive_as_of": f"SELECT item_name, stock FROM ({_STOCK_AS_OF}) WHERE stock > 0",
+    "cash.as_of": f"""
+        SELECT
+            COALESCE((
+                SELECT cash FROM cash_checkpoints
+                WHERE checkpoint_day < :day
+                ORDER BY checkpoint_day DESC
+                LIMIT 1
+            ), 0) + COALESCE((
+                SELECT SUM({_SIGNED_CASH})
+                FROM transactions
+                WHERE transaction_day = :day
+            ), 0) + COALESCE((
+                SELECT SUM(cash) FROM ledger_archive_manifest
+                WHERE month_end_day <= :day
+            ), 0) + :partial_cash AS cash
+    """,
+
+    # ------------------------------------------------------------------
+    # Reports
+    # ------------------------------------------------------------------
+    "report.inventory_valuation": _INVENTORY_VALUATION.format(stock=_STOCK_AS_OF),
+    "report.inventory_status": _INVENTORY_STATUS.format(stock=_STOCK_AS_OF),
+    "report.inventory_status_of_items": _INVENTORY_STATUS.format(stock=_STOCK_AS_OF)
+        + " WHERE i.item_name IN (SELECT value FROM json_each(:item_names))",
+    "report.sales_by_item": """
+        SELECT item_name, SUM(units) as total_units, SUM(price) as total_revenue
+        FROM transactions
+        WHERE transaction_type = 'sales' AND transaction_day <= :day
+        GROUP BY item_name
+        ORDER BY total_revenue DESC
+    """,
+    "report.recent_transactions": """
+        SELECT id, item_name, transaction_type, units, price, transaction_date
+        FROM transactions
+        WHERE transaction_day <= :day
+        ORDER BY transaction_day DESC, id DESC
+        LIMIT 10
+    """,
+    "report.total_between": """
+        SELECT SUM(price)
+        FROM transactions
+        WHERE transaction_type = :transaction_type
+        AND transaction_day BETWEEN :start_day AND :end_day
+    """,
+
+    # ------------------------------------------------------------------
+    # Single transactions
+    # ------------------------------------------------------------------
+    "ledger.all": """
+        SELECT id, item_name, transaction_type, units, price, transaction_date, transaction_day
+        FROM transactions
+        ORDER BY id
+    """,
+    "ledger.transaction_as_of": """
+        SELECT id, item_name, transaction_type, units, price, transaction_date
+        FROM transactions
+        WHERE id = :transaction_id
+        AND transaction_day <= :day
+    """,
+
+    # ------------------------------------------------------------------
+    # Columnar archive of closed months (see ledger_archive.py)
+    # ------------------------------------------------------------------
+    "archive.live_rows_before": """
+        SELECT id, item_name, transaction_type, units, price, transaction_date, transaction_day
+        FROM transactions
+        WHERE transaction_day < :before_day
+        ORDER BY id
+    """,
+    "archive.delete_live_before":
+        "DELETE FROM transactions WHERE transaction_day < :before_day AND id <= :max_id",
+    "archive.insert_partition": """
+        INSERT INTO ledger_archive_partitions (path, month_start_day, month_end_day, row_count, min_id, max_id)
+        VALUES (:path, :month_start_day, :month_end_day, :row_count, :min_id, :max_id)
+    """,
+    "archive.insert_manifest": """
+        INSERT INTO ledger_archive_manifest (
+            path, month_start_day, month_end_day, item_name, units, cash,
+            sales_units, sales_revenue, stock_order_cost, last_day
+        )
+        VALUES (
+            :path, :month_start_day, :month_end_day, :item_name, :units, :cash,
+            :sales_units, :sales_revenue, :stock_order_cost, :last_day
+        )
+    """,
+    "archive.partition_paths": "SELECT path FROM ledger_archive_partitions",
+    "archive.partitions_containing_day": """
+        SELECT path FROM ledger_archive_partitions
+        WHERE month_start_day <= :day AND month_end_day > :day
+    """,
+    "archive.partitions_overlapping": """
+        SELECT path, month_start_day, month_end_day FROM ledger_archive_partitions
+        WHERE month_start_day <= :end_day AND month_end_day >= :start_day
+        ORDER BY month_end_day DESC
+    """,
+    "archive.partitions_through_day": """
+        SELECT path, month_end_day FROM ledger_archive_partitions
+        WHERE month_start_day <= :day
+        ORDER BY month_end_day DESC
+    """,
+    "archive.partition_for_id": """
+        SELECT path FROM ledger_archive_partitions
+        WHERE min_id <= :transaction_id AND max_id >= :transaction_id
+    """,
+    "archive.partition_totals": """
+        SELECT COALESCE(SUM(sales_revenue), 0), COALESCE(SUM(stock_order_cost), 0)
+        FROM ledger_archive_manifest
+        WHERE path = :path
+    """,
+    "archive.sales_through_day": """
+        SELECT item_name, SUM(sales_units), SUM(sales_revenue)
+        FROM ledger_archive_manifest
+        WHERE month_end_day <= :day
+        GROUP BY item_name
+        HAVING SUM(sales_revenue) > 0 OR SUM(sales_units) > 0
+    """,
+
+    # ------------------------------------------------------------------
+    # Inventory reference data
+    # ------------------------------------------------------------------
+    "inventory.reference": "SELECT item_name, category, unit_price, min_stock_level FROM inventory",
+    "inventory.version": "SELECT version FROM table_versions WHERE table_name = 'inventory'",
+
+    # ------------------------------------------------------------------
+    # Pending restock queue
+    # ------------------------------------------------------------------
+    # Items whose net stock fell below their minimum stock level (kept once per item, with the
+    # day it was first queued); a restock run clears the items it looked at
+    "pending_restocks.rebuild": """
+        INSERT INTO pending_restocks (item_name, reason, units, min_stock_level, queued_day)
+        SELECT
+            s.item_name,
+            CASE WHEN s.units <= 0 THEN 'out_of_stock' ELSE 'below_minimum' END,
+            s.units,
+            i.min_stock_level,
+            s.last_transaction_day
+        FROM stock_levels s
+        JOIN inventory i ON i.item_name = s.item_name
+        WHERE s.units < i.min_stock_level
+    """,
+    "pending_restocks.enqueue": """
+        INSERT INTO pending_restocks (item_name, reason, units, min_stock_level, queued_day)
+        VALUES (:item_name, :reason, :units, :min_stock_level, :queued_day)
+        ON CONFLICT(item_name) DO UPDATE SET
+            reason = excluded.reason,
+            units = excluded.units,
+            min_stock_level = excluded.min_stock_level
+    """,
+    "pending_restocks.dequeue":
+        "DELETE FROM pending_restocks WHERE item_name IN (SELECT value FROM json_each(:item_names))",
+    "pending_restocks.items": """
+        SELECT item_name, reason, units, min_stock_level, queued_day
+        FROM pending_restocks
+        ORDER BY queued_day, item_name
+    """,
+
+    # ------------------------------------------------------------------
+    # Backorders
+    # ------------------------------------------------------------------
+    # Order lines waiting for stock; status is 'open', 'filled' (sold on 'filled_day' by ledger
+    # row 'transaction_id') or 'expired' (still open when its due day passed).
+    "backorders.insert": """
+        INSERT INTO backorders (item_name, quantity, price, order_date, due_day)
+        VALUES (:item_name, :quantity, :price, :order_date, :due_day)
+    """,
+    "backorders.last_insert_id": "SELECT last_insert_rowid()",
+    # Open lines of some items (:item_names is a JSON array) still due on or after :from_day,
+    # most urgent first
+    "backorders.open_for_items": """
+        SELECT id, item_name, quantity, price, due_day
+        FROM backorders
+        WHERE status = 'open' AND due_day >= :from_day
+        AND item_name IN (SELECT value FROM json_each(:item_names))
+        ORDER BY due_day, id
+    """,
+    "backorders.fill": """
+        UPDATE backorders SET status = 'filled', filled_day = :filled_day, transaction_id = :transaction_id
+        WHERE id = :id
+    """,
+    # Close the open lines due before :day; they can no longer be delivered in time
+    "backorders.expire": """
+        UPDATE backorders SET status = 'expired'
+        WHERE status = 'open' AND due_day < :day
+    """,
+    "backorders.by_ids": """
+        SELECT id, status, filled_day, transaction_id
+        FROM backorders
+        WHERE id IN (SELECT value FROM json_each(:ids))
+    """,
+
+    # ------------------------------------------------------------------
+    # Reorder planning
+    # ------------------------------------------------------------------
+    # Sales recorded after the planner's watermark, read along the rowid
+    "planner.sales_since": """
+        SELECT id, item_name, transaction_day, units
+        FROM transactions
+        WHERE id > :after_id AND transaction_type = 'sales' AND item_name IS NOT NULL
+        ORDER BY id
+    """,
+
+    # ------------------------------------------------------------------
+    # Quote history
+    # ------------------------------------------------------------------
+    # :query is an FTS5 query over the original request and the quote explanation; the best
+    # BM25 matches come first
+    "quotes.search": """
+        SELECT
+            qr.response AS original_request,
+            q.total_amount,
+            q.quote_explanation,
+            q.job_type,
+            q.order_size,
+            q.event_type,
+            q.order_date
+        FROM quotes_fts f
+        JOIN quotes q ON q.rowid = f.rowid
+        JOIN quote_requests qr ON q.request_id = qr.id
+        WHERE quotes_fts MATCH :query
+        ORDER BY bm25(quotes_fts), q.order_date DESC
+        LIMIT :limit
+    """,
+    "quotes.recent": """
+        SELECT
+            qr.response AS original_request,
+            q.total_amount,
+            q.quote_explanation,
+            q.job_type,
+            q.order_size,
+            q.event_type,
+            q.order_date
+        FROM quotes q
+        JOIN quote_requests qr ON q.request_id = qr.id
+        ORDER BY q.order_date DESC
+        LIMIT :limit
+    """,
+    "quotes.version": "SELECT version FROM table_versions WHERE table_name = 'quotes'",
+    # Text and metadata of every quote, for the similarity index
+    "quotes.corpus": """
+        SELECT
+            q.rowid,
+            COALESCE(qr.response, ''),
+            COALESCE(q.quote_explanation, ''),
+            q.job_type,
+            q.order_size,
+            q.event_type
+        FROM quotes q
+        LEFT JOIN quote_requests qr ON qr.id = q.request_id
+        ORDER BY q.rowid
+    """,
+    # :quote_ids is a JSON array of quote rowids
+    "quotes.by_ids": """
+        SELECT
+            q.rowid,
+            qr.response AS original_request,
+            q.total_amount,
+            q.quote_explanation,
+            q.job_type,
+            q.order_size,
+            q.event_type,
+            q.order_date
+        FROM quotes q
+        LEFT JOIN quote_requests qr ON qr.id = q.request_id
+        WHERE q.rowid IN (SELECT value FROM json_each(:quote_ids))
+    """,
+    "quotes.insert_request": """
+        INSERT INTO quote_requests (id, job, need_size, event, response)
+        VALUES ((SELECT COALESCE(MAX(id), 0) + 1 FROM quote_requests), :job_type, :order_size, :event_type, :request_text)
+    """,
+    "quotes.insert": """
+        INSERT INTO quotes (request_id, total_amount, quote_explanation, order_date, job_type, order_size, event_type)
+        VALUES (
+            (SELECT MAX(id) FROM quote_requests),
+            :total_amount, :quote_explanation, :order_date, :job_type, :order_size, :event_type
+        )
+    """,
+    "quotes.last_insert_id": "SELECT last_insert_rowid()",
+    # Quoted total and request text of every quote, for the discount policy
+    "quotes.priced_requests": """
+        SELECT
+            COALESCE(qr.response, '') AS request_text,
+            q.total_amount,
+            q.job_type,
+            q.order_size,
+            q.event_type
+        FROM quotes q
+        LEFT JOIN quote_requests qr ON qr.id = q.request_id
+        ORDER BY q.rowid
+    """,
+    "discount_policy.insert": """
+        INSERT INTO discount_policy (job_type, order_size, event_type, discount_percentage, quotes, quotes_version)
+        VALUES (:job_type, :order_size, :event_type, :discount_percentage, :quotes, :quotes_version)
+    """,
+    # Drop a table fitted at an older version; rows left after it belong to a newer or equal fit
+    "discount_policy.delete_older": "DELETE FROM discount_policy WHERE quotes_version < :quotes_version",
+    "discount_policy.version": "SELECT MAX(quotes_version) FROM discount_policy",
+    "discount_policy.all": """
+        SELECT job_type, order_size, event_type, discount_percentage, quotes, quotes_version
+        FROM discount_policy
+    """,
+}
+
+
+
+def to_day_number(value: Union[str, date, datetime]) -> int:
+    """
+    Normalize a date to the day number stored in 'transactions.transaction_day'.
+
+    Accepts 'YYYY-MM-DD', full ISO timestamps such as 'YYYY-MM-DDTHH:MM:SS', and date or
+    datetime objects (including pandas Timestamps). Any time of day is dropped.
+
+    Args:
+        value (str, date or datetime): The date to normalize.
+
+    Returns:
+        int: The proleptic Gregorian ordinal of the date (`date.toordinal()`).
+
+    Raises:
+        ValueError: If the value is not a recognizable date.
+    """
+    if isinstance(value, (date, datetime)):
+        return value.toordinal()
+    return date.fromisoformat(str(value).strip()[:10]).toordinal()
+
+
+def day_number_to_date(day: int) -> str:
+    """Return the 'YYYY-MM-DD' string of a day number produced by `to_day_number`."""
+    return date.fromordinal(int(day)).isoformat()
+
+
+_counts_lock = threading.Lock()
+_statement_counts: Counter = Counter()
+
+
+def execute(conn, name: str, params: Optional[Dict] = None):
+    """
+    Execute the named statement on an open SQLAlchemy connection.
+
+    Args:
+        conn: An open SQLAlchemy connection.
+        name (str): A key of `STATEMENTS`.
+        params (Dict, optional): Values for the statement's named parameters.
+
+    Returns:
+        CursorResult: The result of the execution.
+    """
+    with _counts_lock:
+        _statement_counts[name] += 1
+    return conn.exec_driver_sql(STATEMENTS[name], params or {})
+
+
+def execute_many(conn, name: str, rows: Sequence[Dict]):
+    """Execute the named statement once per parameter dictionary with a single `executemany`."""
+    with _counts_lock:
+        _statement_counts[name] += len(rows)
+    return conn.exec_driver_sql(STATEMENTS[name], list(rows))
+
+
+def fetch_all(conn, name: str, params: Optional[Dict] = None) -> List[tuple]:
+    """Execute the named statement and return all of its rows as tuples."""
+    return [tuple(row) for row in execute(conn, name, params).fetchall()]
+
+
+def fetch_one(conn, name: str, params: Optional[Dict] = None) -> Optional[tuple]:
+    """Execute the named statement and return its first row as a tuple, or None."""
+    row = execute(conn, name, params).fetchone()
+    return tuple(row) if row is not None else None
+
+
+def fetch_scalar(conn, name: str, params: Optional[Dict] = None):
+    """Execute the named statement and return the first column of its first row, or None."""
+    return execute(conn, name, params).scalar()
+
+
+def fetch_records(conn, name: str, params: Optional[Dict] = None) -> List[Dict]:
+    """Execute the named statement and return its rows as dictionaries keyed by column name."""
+    return [dict(row._mapping) for row in execute(conn, name, params).fetchall()]
+
+
+def fetch_frame(conn, name: str, params: Optional[Dict] = None) -> pd.DataFrame:
+    """Execute the named statement and return its rows as a DataFrame."""
+    result = execute(conn, name, params)
+    return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+
+def statement_counts() -> Dict[str, int]:
+    """Return how many times each named statement has been executed in this process."""
+    with _counts_lock:
+        return dict(_statement_counts)
+
+
+def reset_statement_counts() -> None:
+    """Reset all execution counters to zero."""
+    with _counts_lock:
+        _statement_counts.clear()
@@ -0,0 +1,179 @@
+"""
+Rule-based extraction of the requested lines of a customer request.
+
+Customer requests mostly follow one shape: a quantity, an optional unit and the item,
+e.g. "500 sheets of glossy A4 paper" or "300 roll of streamers". `extract_lines` finds every
+such mention and resolves its item words against the `Catalog`, trying word spans that end
+as late as possible (the head noun comes last in English) and, among those, the longest, so
+"colorful poster paper" resolves to 'Poster paper' and "kraft paper envelopes" to 'Envelopes'.
+
+Quantities are converted to the units the catalog prices the item in: sheets for paper
+items, single items for products. "10 reams of A4 paper" is 5000 sheets and "2 dozen balloons"
+24 balloons; a unit the item is priced by ("300 roll of streamers") counts as is.
+
+Each line gets a confidence score, which lets callers handle the easy majority of requests
+without a language model and hand the rest over:
+
+- 1.0: the item resolved, its unit converted and every word left out is not part of any
+  catalog name ("colorful"),
+- `AMBIGUOUS_LINE_CONFIDENCE`: a left-out word is part of a catalog name ("heavyweight
+  cardstock" resolves to 'Cardstock', although 'Heavyweight paper' exists too),
+- `UNKNOWN_UNIT_CONFIDENCE`: the unit cannot be converted to catalog units ("5 boxes of
+  A4 paper"); the quantity is kept as written,
+- 0.0: no catalog item was found, or the quantity is 0.
+"""
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+from catalog import Catalog, normalize_name
+
+# Confidence of a line whose item resolved after leaving out a word of some catalog name
+AMBIGUOUS_LINE_CONFIDENCE = 0.5
+
+# Confidence of a line whose unit cannot be converted to the units the item is priced in
+UNKNOWN_UNIT_CONFIDENCE = 0.5
+
+# Catalog units per unit, for units that mean the same for every item (normalized names)
+UNIT_SIZES = {"sheet": 1, "unit": 1, "piece": 1, "pc": 1, "count": 1, "dozen": 12}
+
+# Sheets per ream, for items of the categories priced per sheet
+SHEETS_PER_REAM = 500
+SHEET_CATEGORIES = frozenset({"paper", "specialty"})
+
+# Products priced per roll or per pad, so a quantity in that unit is already in catalog units
+PRICED_PER = {
+    "Party streamers": "roll",
+    "Decorative adhesive tape (washi tape)": "roll",
+    "Adhesive tape": "roll",
+    "Decorative masking tape": "roll",
+    "Biodegradable packaging tape": "roll",
+    "Rolls of banner paper (36-inch width)": "roll",
+    "Notepads": "pad",
+}
+
+_MONTHS = "january|february|march|april|may|june|july|august|september|october|november|december"
+
+# Dates are blanked out before quantities are looked for, so "April 15, 2025" is not a line
+_DATE = re.compile(
+    rf"\b(?:{_MONTHS}|(?:jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec)\.?)\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}}\b"
+    r"|\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}/\d{1,2}/\d{2,4}\b",
+    re.IGNORECASE,
+)
+
+# A quantity (not part of a decimal, a size like 8.5"x11", a percentage or a price), an
+# optional unit and the item words, which run to the next clause boundary
+_LINE = re.compile(
+    r"(?<![\w.,$/])(?P<quantity>\d{1,3}(?:,\d{3})+|\d+)(?![\w.,%\"'/-])\s+"
+    r"(?:(?P<unit>sheets?|reams?|rolls?|packs?|packets?|packages?|boxes|box|pieces?|units?|sets?|pads?|cases?|bundles?|"
+    r"pcs|count|dozens?)\s+)?"
+    r"(?:of\s+)?"
+    r"(?P<words>.+?)"
+    r"(?=\s+(?:and|for|in|with|by|to|that|which|so|as|from|at|on)\b|\s*[;:!?\n(]|\.(?:\s|$)|,\s*(?:and\b|\d)|$)",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class RequestLine:
+    text: str                   # the words of the request the line was read from
+    quantity: int               # in catalog units, or as written if the unit did not convert
+    unit: Optional[str]         # e.g. 'reams', as written; None if no unit was given
+    item_name: Optional[str]    # catalog name, or None if nothing resolved
+    confidence: float
+
+
+def strip_dates(text: str) -> str:
+    """Replace every date in `text` (e.g. 'April 15, 2025' or '2025-04-15') by spaces of the same length."""
+    return _DATE.sub(lambda match: " " * len(match.group(0)), text)
+
+
+def extract_lines(text: str, catalog: Catalog) -> List[RequestLine]:
+    """
+    Find the quantity-and-item mentions of a request.
+
+    Args:
+        text (str): The customer request.
+        catalog (Catalog): The catalog item words are resolved against.
+
+    Returns:
+        List[RequestLine]: One line per mention, in request order, resolved or not.
+    """
+    vocabulary = _catalog_vocabulary(catalog)
+    lines = []
+    for match in _LINE.finditer(strip_dates(str(text or ""))):
+        words = match.group("words").split()
+        record, confidence = _resolve_words(words, catalog, vocabulary)
+        quantity = int(match.group("quantity").replace(",", ""))
+        unit = match.group("unit").lower() if match.group("unit") else None
+        if record is not None:
+            size = unit_size(record, unit)
+            if size is None:
+                confidence = min(confidence, UNKNOWN_UNIT_CONFIDENCE)
+            else:
+                quantity *= size
+        if quantity <= 0:
+            confidence = 0.0
+        lines.append(
+            RequestLine(
+                text=match.group(0).strip(),
+                quantity=quantity,
+                unit=unit,
+                item_name=record["item_name"] if record is not None else None,
+                confidence=confidence,
+            )
+        )
+    return lines
+
+
+def unit_size(record: dict, unit: Optional[str]) -> Optional[int]:
+    """
+    How many catalog units one unit of an item is.
+
+    Args:
+        record (dict): The item's catalog record.
+        unit (str, optional): The unit as written, e.g. 'reams'; None if none was given.
+
+    Returns:
+        Optional[int]: The catalog units per unit, or None if the unit does not convert.
+    """
+    if unit is None:
+        return 1
+    unit = normalize_name(unit)
+    if unit in UNIT_SIZES:
+        return UNIT_SIZES[unit]
+    if unit == "ream" and record["category"] in SHEET_CATEGORIES:
+        return SHEETS_PER_REAM
+    if PRICED_PER.get(record["item_name"]) == unit:
+        return 1
+    return None
+
+
+def request_confidence(lines: List[RequestLine]) -> float:
+    """The confidence of a whole request: that of its least certain line, or 0.0 if it has none."""
+    return min((line.confidence for line in lines), default=0.0)
+
+
+def _resolve_words(words: List[str], catalog: Catalog, vocabulary: frozenset) -> "tuple[Optional[dict], float]":
+    """Resolve the latest-ending, then longest, span of `words` that names a catalog item, to its record."""
+    for end in range(len(words), 0, -1):
+        for start in range(end):
+            record = catalog.resolve(" ".join(words[start:end]))
+            if record is None:
+                continue
+            # Words of the resolved name itself ('standard printer paper') are not ambiguous
+            left_out = {normalize_name(word) for word in words[:start] + words[end:]}
+            left_out -= _name_words(record["item_name"])
+            confidence = AMBIGUOUS_LINE_CONFIDENCE if left_out & vocabulary else 1.0
+            return record, confidence
+    return None, 0.0
+
+
+def _catalog_vocabulary(catalog: Catalog) -> frozenset:
+    """Normalized words of every catalog name, except 'paper', which every other name ends in."""
+    return frozenset(word for name in catalog.names() for word in _name_words(name)) - {"paper"}
+
+
+def _name_words(name: str) -> set:
+    """The normalized words of a name."""
+    return {normalize_name(word) for word in re.split(r"[^A-Za-z0-9]+", name) if word}
@@ -0,0 +1,186 @@
+"""
+In-process stock threshold events.
+
+Every ledger write compares each touched item's net stock before and after the write with
+its `min_stock_level` and emits a `StockEvent` when the stock:
+
+- falls below the minimum stock level ('below_minimum'),
+- reaches zero or less ('out_of_stock'),
+- climbs back to the minimum stock level or above ('restored').
+
+Events are published on a `StockEventBus` after the write commits. Subscribers either get a
+callback per event or drain a queue, e.g. a `RestockWorker` that restocks only the items that
+crossed a threshold instead of rescanning the whole catalog.
+"""
+import logging
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+# Event kinds, in the order they are checked
+EVENT_KINDS = ("below_minimum", "out_of_stock", "restored")
+
+
+@dataclass(frozen=True)
+class StockEvent:
+    item_name: str
+    kind: str                 # one of EVENT_KINDS
+    units_before: int         # net stock before the write
+    units_after: int          # net stock after the write
+    min_stock_level: int
+    transaction_day: int      # latest day written for the item
+
+
+def threshold_events(
+    units_before: Dict[str, int],
+    units_delta: Dict[str, int],
+    min_stock_levels: Dict[str, int],
+    transaction_days: Dict[str, int],
+) -> List[StockEvent]:
+    """
+    Compare the stock of every written item before and after a write.
+
+    Args:
+        units_before (Dict[str, int]): Net stock per item before the write (missing items count as 0).
+        units_delta (Dict[str, int]): Net stock movement of the write per item.
+        min_stock_levels (Dict[str, int]): Minimum stock level per item.
+        transaction_days (Dict[str, int]): Latest day written per item.
+
+    Returns:
+        List[StockEvent]: The crossings, in item order of `units_delta`.
+    """
+    events = []
+    for item_name, delta in units_delta.items():
+        before = int(units_before.get(item_name, 0))
+        after = before + int(delta)
+        minimum = int(min_stock_levels[item_name])
+        kinds = []
+        if before >= minimum > after:
+            kinds.append("below_minimum")
+        if before > 0 >= after:
+            kinds.append("out_of_stock")
+        if before < minimum <= after:
+            kinds.append("restored")
+        events.extend(
+            StockEvent(item_name, kind, before, after, minimum, transaction_days[item_name]) for kind in kinds
+        )
+    return events
+
+
+class Subscription:
+    """A registered subscriber; call `unsubscribe` to stop receiving events."""
+
+    def __init__(self, bus: "StockEventBus", callback: Callable[[StockEvent], None], kinds: Optional[Sequence[str]]):
+        self._bus = bus
+        self.callback = callback
+        self.kinds = None if kinds is None else frozenset(kinds)
+
+    def wants(self, event: StockEvent) -> bool:
+        return self.kinds is None or event.kind in self.kinds
+
+    def unsubscribe(self) -> None:
+        self._bus._remove(self)
+
+
+class StockEventBus:
+    """Thread-safe publish/subscribe of `StockEvent`s."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: List[Subscription] = []
+        self.published = 0
+
+    def subscribe(self, callback: Callable[[StockEvent], None], kinds: Optional[Sequence[str]] = None) -> Subscription:
+        """
+        Call `callback` with every future event (of the given kinds only, if any).
+
+        Callbacks run on the writing thread after the write commits; exceptions they raise are
+        logged and do not affect the write or other subscribers.
+
+        Args:
+            callback (Callable[[StockEvent], None]): The handler.
+            kinds (Sequence[str], optional): Event kinds to receive. Default is every kind.
+
+        Returns:
+            Subscription: The handle to unsubscribe with.
+
+        Raises:
+            ValueError: If a kind is unknown.
+        """
+        unknown = set(kinds or ()) - set(EVENT_KINDS)
+        if unknown:
+            raise ValueError(f"Unknown stock event kinds: {sorted(unknown)}")
+        subscription = Subscription(self, callback, kinds)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def subscribe_queue(self, kinds: Optional[Sequence[str]] = None) -> "tuple[queue.Queue, Subscription]":
+        """Put every future event (of the given kinds) on a new queue; returns the queue and its subscription."""
+        events: queue.Queue = queue.Queue()
+        return events, self.subscribe(events.put, kinds)
+
+    def _remove(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, events: Iterable[StockEvent]) -> None:
+        """Deliver events to every interested subscriber, in order."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for event in events:
+            self.published += 1
+            for subscription in subscriptions:
+                if not subscription.wants(event):
+                    continue
+                try:
+                    subscription.callback(event)
+                except Exception:
+                    logging.exception("Stock event subscriber failed on %s", event)
+
+
+class RestockWorker:
+    """
+    A daemon thread that drains threshold events and runs a restock for the affected items.
+
+    Events that arrive while a restock runs are batched into the next one.
+    """
+
+    def __init__(self, bus: StockEventBus, restock: Callable[[List[StockEvent]], None]):
+        """
+        Args:
+            bus (StockEventBus): The bus to subscribe to ('below_minimum' and 'out_of_stock' events).
+            restock (Callable[[List[StockEvent]], None]): Called with each batch of events.
+        """
+        self._events, self._subscription = bus.subscribe_queue(kinds=("below_minimum", "out_of_stock"))
+        self._restock = restock
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="restock-worker", daemon=True)
+
+    def start(self) -> "RestockWorker":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Unsubscribe and stop after the current batch."""
+        self._subscription.unsubscribe()
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch = [self._events.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    batch.append(self._events.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._restock(batch)
+            except Exception:
+                logging.exception("Restock worker failed")
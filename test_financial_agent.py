@@ -10,8 +10,27 @@ from project_starter import (
     get_available_paper_supplies,
     init_database,
     ToolCallingAgent,
-    OpenAIServerModel
+    OpenAIServerModel,
+    create_transaction,
+    get_stock_level,
+    get_all_inventory,
+    rebuild_ledger_projections,
+    create_db_engine,
+    create_ledger_backend,
+    get_inventory_report,
+    process_order,
+    restock_inventory,
+    OrderItem,
+    check_order_status,
+    ToolContext,
+    use_tool_context,
+    start_ledger_archiver,
+    db_engine
 )
+import shutil
+import time
+import pandas as pd
+import ledger_archive
 
 # Fixture for setting up the test environment
 @pytest.fixture(scope="module")
@@ -87,6 +106,156 @@ def test_get_financial_status():
     result = get_financial_status("2028-01-01")
     assert isinstance(result, FinancialStatus)
 
+def test_checkpointed_queries_match_ledger():
+    """Test that checkpoint-based as-of queries agree with a full ledger scan, including backdated writes."""
+    init_database()
+    create_transaction("A4 paper", "sales", 40, 8.0, "2025-03-02")
+    create_transaction("Cardstock", "stock_orders", 300, 20.0, "2025-03-10")
+    # Warm checkpoints up to a late date, then write behind them
+    get_cash_balance("2025-06-01")
+    get_all_inventory("2025-06-01")
+    create_transaction("A4 paper", "sales", 25, 5.0, "2025-02-15")
+    create_transaction("Cardstock", "sales", 10, 3.0, "2025-07-01")
+
+    ledger = pd.read_sql("SELECT * FROM transactions", db_engine)
+    ledger["signed_units"] = ledger["units"].where(ledger["transaction_type"] == "stock_orders", -ledger["units"])
+    ledger["signed_cash"] = ledger["price"].where(ledger["transaction_type"] == "sales", -ledger["price"])
+    # Seed rows are ISO timestamps and later rows plain dates; both count from their day on
+    ledger["day"] = pd.to_datetime(ledger["transaction_date"].str[:10])
+
+    for as_of_date in ["2024-12-31", "2025-01-01", "2025-02-15", "2025-03-05", "2025-06-01", "2025-07-01", "2025-12-31"]:
+        rows = ledger[ledger["day"] <= pd.Timestamp(as_of_date)]
+        assert get_cash_balance(as_of_date) == pytest.approx(rows["signed_cash"].sum())
+        for item_name in ["a4 paper", "cardstock"]:
+            expected = int(rows.loc[rows["item_name"] == item_name, "signed_units"].sum())
+            assert int(get_stock_level(item_name, as_of_date)["current_stock"].iloc[0]) == expected
+            assert get_all_inventory(as_of_date).get(item_name, 0) == max(expected, 0)
+
+def test_migrate_saved_database(tmp_path):
+    """Test that a database from saved_outputs/ is migrated to day numbers and answers as-of queries."""
+    db_path = tmp_path / "munder_difflin.db"
+    shutil.copy(os.path.join(os.path.dirname(__file__), "saved_outputs", "full_output2", "munder_difflin.db"), db_path)
+    engine = create_db_engine(str(db_path))
+
+    ledger = pd.read_sql("SELECT * FROM transactions", engine)
+    ledger["signed_cash"] = ledger["price"].where(ledger["transaction_type"] == "sales", -ledger["price"])
+    ledger["day"] = pd.to_datetime(ledger["transaction_date"].str[:10])
+
+    rebuild_ledger_projections(engine)
+    with use_tool_context(ToolContext(engine=engine)):
+        for as_of_date in ["2025-01-01", "2025-04-01", "2025-04-19T12:00:00"]:
+            rows = ledger[ledger["day"] <= pd.Timestamp(as_of_date[:10])]
+            assert get_cash_balance(as_of_date) == pytest.approx(rows["signed_cash"].sum())
+
+    days = pd.read_sql("SELECT transaction_date, transaction_day FROM transactions", engine)
+    assert days["transaction_day"].notna().all()
+    engine.dispose()
+
+def test_numpy_ledger_matches_sqlite(tmp_path):
+    """Test that the in-memory NumPy ledger answers every ledger tool like the SQLite ledger."""
+    def replay():
+        init_database()
+        create_transaction("A4 paper", "sales", 40, 8.0, "2025-03-02")
+        process_order([OrderItem(item_name="Cardstock", quantity=5000, price=900.0)], "2025-03-05", "2025-04-01")
+        restock_inventory("2025-03-10")
+        create_transaction("Glossy paper", "sales", 10, 3.0, "2025-02-15")
+        answers = []
+        for as_of_date in ["2025-01-01", "2025-03-05", "2025-03-10T09:00:00", "2025-12-31"]:
+            report = generate_financial_report(as_of_date)
+            status = get_financial_status(as_of_date)
+            answers.append((
+                round(get_cash_balance(as_of_date), 6),
+                int(get_stock_level("Cardstock", as_of_date)["current_stock"].iloc[0]),
+                get_all_inventory(as_of_date),
+                report["inventory_value"],
+                report["top_selling_products"],
+                get_inventory_report(as_of_date).model_dump(),
+                status.revenue_30_days,
+                status.expenses_30_days,
+                status.recent_transactions,
+            ))
+        return answers
+
+    with use_tool_context(ToolContext(engine=create_db_engine(str(tmp_path / "sqlite.db")))):
+        expected = replay()
+    with use_tool_context(ToolContext(engine=create_db_engine(str(tmp_path / "numpy.db")), ledger=create_ledger_backend("numpy"))):
+        actual = replay()
+
+    assert actual == expected
+
+def test_archive_closed_months(tmp_path):
+    """Test that archiving closed months to partition files leaves every as-of answer unchanged."""
+    engine = create_db_engine(str(tmp_path / "archive.db"))
+    dates = ["2025-01-01", "2025-02-10", "2025-02-28", "2025-03-15T10:00:00", "2025-04-02", "2025-04-30"]
+
+    def answers():
+        results = []
+        for as_of_date in dates:
+            report = generate_financial_report(as_of_date)
+            status = get_financial_status(as_of_date)
+            results.append((
+                round(get_cash_balance(as_of_date), 6),
+                int(get_stock_level("A4 paper", as_of_date)["current_stock"].iloc[0]),
+                get_all_inventory(as_of_date),
+                round(report["inventory_value"], 6),
+                [(row["item_name"], row["total_units"], round(row["total_revenue"], 6)) for row in report["top_selling_products"]],
+                get_inventory_report(as_of_date).model_dump(),
+                round(status.revenue_30_days, 6),
+                round(status.expenses_30_days, 6),
+                status.recent_transactions,
+            ))
+        return results
+
+    with use_tool_context(ToolContext(engine=engine)):
+        init_database()
+        create_transaction("A4 paper", "sales", 40, 8.0, "2025-02-10")
+        archived_id = create_transaction("A4 paper", "stock_orders", 300, 20.0, "2025-02-20")
+        create_transaction("Cardstock", "sales", 15, 6.0, "2025-03-15")
+        create_transaction("A4 paper", "sales", 25, 5.0, "2025-04-02")
+        expected = answers()
+
+        # The stock order dated after April must not close April
+        create_transaction("Cardstock", "stock_orders", 100, 10.0, "2025-05-20")
+        expected = answers()
+        paths = ledger_archive.archive_closed_months(engine, as_of_date="2025-04-10")
+        assert len(paths) == 3
+        live_days = pd.read_sql("SELECT transaction_day FROM transactions", engine)["transaction_day"]
+        assert live_days.min() >= pd.Timestamp("2025-04-01").toordinal()
+
+        assert answers() == expected
+        assert check_order_status(archived_id, "2025-03-01").transaction_date == "2025-02-20"
+
+        # A backdated write into an archived month stays live and still counts, until the next
+        # run archives it into an extra partition for that month
+        create_transaction("A4 paper", "sales", 5, 1.0, "2025-02-15")
+        stock = int(get_stock_level("A4 paper", "2025-02-20")["current_stock"].iloc[0])
+        assert stock == expected[1][1] + 300 - 5
+        assert len(ledger_archive.archive_closed_months(engine, as_of_date="2025-04-10")) == 1
+        assert int(get_stock_level("A4 paper", "2025-02-20")["current_stock"].iloc[0]) == stock
+        with engine.connect() as conn:
+            assert ledger_archive.recent_transactions(conn, pd.Timestamp("2025-03-31").toordinal(), 0) == []
+    engine.dispose()
+
+def test_ledger_archiver(tmp_path):
+    """Test that the background archiver archives the months before the current date and stops."""
+    engine = create_db_engine(str(tmp_path / "archiver.db"))
+    with use_tool_context(ToolContext(engine=engine)):
+        init_database()
+        create_transaction("A4 paper", "sales", 40, 8.0, "2025-02-10")
+        create_transaction("A4 paper", "sales", 10, 2.0, "2025-03-05")
+        assert start_ledger_archiver(interval_seconds=0) is None
+
+        archiver = start_ledger_archiver(interval_seconds=0.05, current_date=lambda: "2025-03-10")
+        deadline = time.time() + 10
+        while archiver.runs < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        archiver.stop()
+
+        assert archiver.runs >= 2 and not archiver._thread.is_alive()
+        assert len(os.listdir(ledger_archive.archive_dir(engine))) == 2
+        live_days = pd.read_sql("SELECT transaction_day FROM transactions", engine)["transaction_day"]
+        assert live_days.min() == pd.Timestamp("2025-03-05").toordinal()
+    engine.dispose()
 
 def test_financial_agent_cash_balance(financial_agent):
     """Test the financial agent's ability to get cash balance."""
@@ -1,18 +1,32 @@
 import pytest
 import os
 import dotenv
+import pandas as pd
+import repository
 from project_starter import (
     InventoryStatus,
     InventoryReport,
     RestockReport,
     check_inventory_status,
+    check_inventory_bulk,
     get_inventory_report,
     restock_inventory,
     get_available_paper_supplies,
     init_database,
     ToolCallingAgent,
     CodeAgent,
-    OpenAIServerModel, create_transaction
+    OpenAIServerModel, create_transaction,
+    get_stock_level,
+    get_all_inventory,
+    get_supplier_delivery_date,
+    db_engine,
+    ToolContext,
+    use_tool_context,
+    create_db_engine,
+    lookup_cache_stats,
+    get_tool_context,
+    _reorder_plan,
+    subscribe_stock_events
 )
 
 # Fixture for setting up the test environment
@@ -96,6 +110,53 @@ def test_get_inventory_report():
     assert hasattr(result, 'items_in_stock')
     assert hasattr(result, 'inventory_value')
 
+def test_get_inventory_report_selected_lists():
+    """Test that only the requested item lists are filled while counts and value cover every item."""
+    full = get_inventory_report("2025-08-01")
+    partial = get_inventory_report("2025-08-01", include=["out_of_stock"])
+
+    assert partial.items_in_stock_list == [] and partial.items_below_threshold_list == []
+    assert partial.items_out_of_stock_list == full.items_out_of_stock_list
+    assert (partial.items_in_stock, partial.items_below_threshold, partial.items_out_of_stock) == \
+        (full.items_in_stock, full.items_below_threshold, full.items_out_of_stock)
+    assert partial.inventory_value == pytest.approx(full.inventory_value)
+    assert full.items_in_stock == len(full.items_in_stock_list)
+    assert full.total_items == full.items_in_stock + full.items_below_threshold + full.items_out_of_stock
+    for item in full.items_below_threshold_list:
+        assert 0 < item.current_stock < item.min_stock_level
+
+def test_check_inventory_status_resolves_names():
+    """Test that case, plurals, punctuation and aliases resolve to the paper_supplies name."""
+    init_database()
+    expected = check_inventory_status("Standard copy paper", 10, "2025-08-01")
+    for name in ["copy paper", "STANDARD COPY PAPERS", "standard-copy paper"]:
+        assert check_inventory_status(name, 10, "2025-08-01") == expected
+    assert check_inventory_status("card stock", 10, "2025-08-01").item_name == "cardstock"
+
+    result = check_inventory_status("glosy paper", 10, "2025-08-01")
+    assert "Invalid item name" in result.status and "Glossy paper" in result.status
+
+def test_check_inventory_bulk():
+    """Test that a basket check matches per-item checks and allocates repeated items in order."""
+    init_database()
+    lines = [
+        {"item_name": "A4 paper", "quantity": 100},
+        {"item_name": "Cardstock", "quantity": 50},
+        {"item_name": "Not a paper", "quantity": 1},
+    ]
+    statuses = check_inventory_bulk(lines, "2025-08-01")
+
+    assert len(statuses) == len(lines)
+    for line, status in zip(lines[:2], statuses):
+        assert status == check_inventory_status(line["item_name"], line["quantity"], "2025-08-01")
+    assert not statuses[2].available and statuses[2].status.startswith("Invalid item name")
+
+    # A repeated item is checked against the stock left after the earlier line
+    stock = statuses[0].current_stock
+    repeated = check_inventory_bulk([("A4 paper", stock), ("A4 paper", 1)], "2025-08-01")
+    assert repeated[0].available
+    assert repeated[1].current_stock == 0 and not repeated[1].available
+
 def test_inventory_agent_check_status(inventory_agent):
     """Test the inventory agent's ability to check inventory status."""
     query = "Check if we have 50 Letter-sized paper available as of August 1, 2025."
@@ -207,6 +268,156 @@ def test_restock_inventory():
         assert hasattr(item, 'delivery_date')
         assert hasattr(item, 'transaction_id')
 
+def test_restock_inventory_batch(monkeypatch):
+    """Test that a restock run is written as one batch and rolled back as a whole on failure."""
+    init_database()
+    create_transaction("A4 paper", "sales", 700, 50, "2025-07-31")
+    with db_engine.connect() as conn:
+        ledger_rows = len(repository.fetch_all(conn, "ledger.all"))
+
+    # A failure after the insert leaves no stock order behind
+    def fail_on_invalidate(conn, name, params=None):
+        if name == "checkpoints.invalidate_cash":
+            raise RuntimeError("disk full")
+        return original_execute(conn, name, params)
+    original_execute = repository.execute
+    monkeypatch.setattr(repository, "execute", fail_on_invalidate)
+    failed = restock_inventory("2025-08-01")
+    monkeypatch.undo()
+
+    assert failed.restocked_items and all(item.status.startswith("Error") for item in failed.restocked_items)
+    with db_engine.connect() as conn:
+        assert len(repository.fetch_all(conn, "ledger.all")) == ledger_rows
+
+    result = restock_inventory("2025-08-01")
+    assert [item.item_name for item in result.restocked_items] == [item.item_name for item in failed.restocked_items]
+    for item in result.restocked_items:
+        assert item.status == "Restocked" and item.quantity > 0
+        assert item.delivery_date == get_supplier_delivery_date("2025-08-01", item.quantity)
+    ids = [item.transaction_id for item in result.restocked_items]
+    assert ids == list(range(ids[0], ids[0] + len(ids)))
+    assert result.total_restock_cost == pytest.approx(sum(item.price for item in result.restocked_items))
+
+def test_stock_events_queue_pending_restocks():
+    """Test that writes crossing the minimum stock level publish events and queue only those items for restock."""
+    init_database()
+    # A full run looks at every item, so it leaves the queue empty
+    restock_inventory("2025-07-31")
+
+    def pending():
+        return list(pd.read_sql("SELECT item_name FROM pending_restocks", db_engine)["item_name"])
+
+    def net_units():
+        return int(pd.read_sql("SELECT units FROM stock_levels WHERE item_name = 'a4 paper'", db_engine)["units"].iloc[0])
+
+    assert pending() == []
+    events = []
+    subscription = subscribe_stock_events(events.append)
+    minimum = check_inventory_status("A4 paper", 1, "2025-08-01").min_stock_level
+
+    create_transaction("A4 paper", "sales", net_units() - minimum + 1, 10.0, "2025-08-01")
+    create_transaction("A4 paper", "sales", minimum - 1, 10.0, "2025-08-01")
+    assert [(event.item_name, event.kind) for event in events] == [("a4 paper", "below_minimum"), ("a4 paper", "out_of_stock")]
+    assert events[1].units_after == 0 and events[1].min_stock_level == minimum
+    assert pending() == ["a4 paper"]
+
+    result = restock_inventory("2025-08-01", pending_only=True)
+    assert [item.item_name for item in result.restocked_items] == ["a4 paper"]
+    assert events[-1].kind == "restored" and net_units() >= minimum
+    assert pending() == []
+
+    subscription.unsubscribe()
+    create_transaction("A4 paper", "sales", net_units(), 10.0, "2025-08-02")
+    assert events[-1].kind == "restored" and pending() == ["a4 paper"]
+
+def test_reorder_plan_follows_demand():
+    """Test that reorder points grow with recent sales and that the planner only reads new sales."""
+    init_database()
+    quiet = _reorder_plan(["a4 paper", "cardstock"], [10, 10], "2025-08-01")
+    planner = get_tool_context().planner
+    seen = len(planner)
+
+    for day in range(1, 29, 3):
+        create_transaction("A4 paper", "sales", 40, 4.0, f"2025-07-{day:02d}")
+    busy = _reorder_plan(["a4 paper", "cardstock"], [10, 10], "2025-08-01")
+
+    assert len(planner) == seen + 10
+    assert busy.demand_rate[0] > quiet.demand_rate[0]
+    assert busy.reorder_point[0] > quiet.reorder_point[0]
+    assert busy.reorder_point[1] == quiet.reorder_point[1] >= 10
+    assert (busy.order_up_to > busy.reorder_point).all()
+
+    # A restock brings the item back to its order-up-to level
+    status = check_inventory_status("A4 paper", 1, "2025-08-01")
+    plan = _reorder_plan(["a4 paper"], [status.min_stock_level], "2025-08-01")
+    assert status.needs_restock and not status.available
+    assert status.restock_quantity == plan.order_up_to[0] - status.current_stock + 1
+
+def test_lookup_cache_invalidation():
+    """Test that cached stock lookups survive unrelated writes and are dropped by writes on or before their day."""
+    init_database()
+
+    def stock(item_name, date):
+        return int(get_stock_level(item_name, date)["current_stock"].iloc[0])
+
+    a4_early, a4_late, cardstock = stock("A4 paper", "2025-08-01"), stock("A4 paper", "2025-08-10"), stock("Cardstock", "2025-08-10")
+    misses = lookup_cache_stats()["stock"]["misses"]
+    assert stock("A4 paper", "2025-08-01") == a4_early
+    assert lookup_cache_stats()["stock"]["misses"] == misses
+
+    # A sale on the 5th changes A4 stock from the 5th on only
+    create_transaction("A4 paper", "sales", 10, 1.0, "2025-08-05")
+    hits = lookup_cache_stats()["stock"]["hits"]
+    assert stock("A4 paper", "2025-08-01") == a4_early
+    assert stock("Cardstock", "2025-08-10") == cardstock
+    assert lookup_cache_stats()["stock"]["hits"] == hits + 2
+    assert stock("A4 paper", "2025-08-10") == a4_late - 10
+    assert lookup_cache_stats()["stock"]["misses"] == misses + 1
+
+    # Reference rows reload only after the inventory table changes
+    check_inventory_status("A4 paper", 1, "2025-08-01")
+    reloads = lookup_cache_stats()["reference"]["reloads"]
+    check_inventory_status("Cardstock", 1, "2025-08-01")
+    assert lookup_cache_stats()["reference"]["reloads"] == reloads
+    with db_engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE inventory SET min_stock_level = 5000 WHERE item_name = 'a4 paper'")
+    assert check_inventory_status("A4 paper", 1, "2025-08-01").min_stock_level == 5000
+    assert lookup_cache_stats()["reference"]["reloads"] == reloads + 1
+
+def test_lookup_cache_across_contexts(tmp_path):
+    """Test that a write from another tool context on the same database is not hidden by the stock cache."""
+    path = str(tmp_path / "shared.db")
+    reader, writer = ToolContext(engine=create_db_engine(path)), ToolContext(engine=create_db_engine(path))
+    with use_tool_context(reader):
+        init_database()
+        before = int(get_stock_level("A4 paper", "2025-08-01")["current_stock"].iloc[0])
+        assert check_inventory_status("A4 paper", 1, "2025-08-01").current_stock == before
+    with use_tool_context(writer):
+        create_transaction("A4 paper", "sales", 100, 10.0, "2025-07-01")
+        assert int(get_stock_level("A4 paper", "2025-08-01")["current_stock"].iloc[0]) == before - 100
+    with use_tool_context(reader):
+        assert int(get_stock_level("A4 paper", "2025-08-01")["current_stock"].iloc[0]) == before - 100
+        assert check_inventory_status("A4 paper", 1, "2025-08-01").current_stock == before - 100
+    reader.engine.dispose()
+    writer.engine.dispose()
+
+def test_stock_level_projection():
+    """Test that the stock_levels projection agrees with the ledger before and after writes."""
+    init_database()
+    before = int(get_stock_level("A4 paper", "2025-07-31")["current_stock"].iloc[0])
+
+    create_transaction("A4 paper", "sales", 50, 5.0, "2025-08-01")
+    create_transaction("A4 paper", "stock_orders", 20, 1.0, "2025-08-05")
+
+    # Current stock is served by the projection
+    assert int(get_stock_level("A4 paper", "2025-08-10")["current_stock"].iloc[0]) == before - 30
+    assert get_all_inventory("2025-08-10")["a4 paper"] == before - 30
+
+    # Past dates fall back to the ledger
+    assert int(get_stock_level("A4 paper", "2025-08-02")["current_stock"].iloc[0]) == before - 50
+    assert get_all_inventory("2025-08-02")["a4 paper"] == before - 50
+    assert int(get_stock_level("A4 paper", "2025-07-31")["current_stock"].iloc[0]) == before
+
 def test_inventory_agent_restock(inventory_agent):
     """Test the inventory agent's ability to restock inventory."""
 
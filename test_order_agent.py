@@ -11,8 +11,20 @@ from project_starter import (
     init_database,
     ToolCallingAgent,
     OpenAIServerModel,
-    OrderItem
+    OrderItem,
+    create_transactions,
+    create_transaction,
+    get_stock_level,
+    get_cash_balance,
+    create_db_engine,
+    ToolContext,
+    use_tool_context,
+    db_engine,
+    availability_timeline,
+    availability_timelines
 )
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 
 # Fixture for setting up the test environment
 @pytest.fixture(scope="module")
@@ -113,7 +125,165 @@ def test_check_order_status():
             print(result)
             assert isinstance(result, OrderStatus)
 
+def test_create_transactions():
+    """Test that a batch of transactions is written in one commit and returns the exact IDs."""
+    init_database()
+    rows = [
+        {"item_name": "A4 paper", "transaction_type": "sales", "quantity": 10, "price": 1.0, "date": "2025-08-01"},
+        {"item_name": "Cardstock", "transaction_type": "stock_orders", "quantity": 200, "price": 15.0, "date": "2025-08-05"},
+        {"item_name": "A4 paper", "transaction_type": "sales", "quantity": 5, "price": 0.5, "date": "2025-08-02"},
+    ]
+    transaction_ids = create_transactions(rows)
+    assert len(transaction_ids) == len(rows)
+
+    for transaction_id, row in zip(transaction_ids, rows):
+        stored = pd.read_sql("SELECT * FROM transactions WHERE id = :id", db_engine, params={"id": transaction_id})
+        assert stored["item_name"].iloc[0] == row["item_name"].lower()
+        assert stored["units"].iloc[0] == row["quantity"]
+        assert stored["transaction_date"].iloc[0] == row["date"]
+
+    # An invalid row rolls back the whole batch
+    count_before = pd.read_sql("SELECT COUNT(*) AS n FROM transactions", db_engine)["n"].iloc[0]
+    with pytest.raises(ValueError):
+        create_transactions([rows[0], {**rows[1], "transaction_type": "refund"}])
+    count_after = pd.read_sql("SELECT COUNT(*) AS n FROM transactions", db_engine)["n"].iloc[0]
+    assert count_after == count_before
+
+def test_tool_context_per_worker_database(tmp_path):
+    """Test that workers with their own tool context read and write their own database file."""
+    def worker(units):
+        engine = create_db_engine(str(tmp_path / f"worker_{units}.db"))
+        with use_tool_context(ToolContext(engine=engine)):
+            init_database()
+            create_transaction("A4 paper", "stock_orders", units, 1.0, "2025-08-01")
+            stock = int(get_stock_level("A4 paper", "2025-08-01")["current_stock"].iloc[0])
+        with engine.connect() as conn:
+            journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+        return stock, journal_mode
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        (stock_a, journal_a), (stock_b, journal_b) = executor.map(worker, [10, 1000])
+
+    assert stock_b - stock_a == 990
+    assert journal_a == journal_b == "wal"
+
+
+def test_concurrent_orders_never_oversell(tmp_path):
+    """Test that parallel workers on one database cannot sell the same units twice."""
+    path = str(tmp_path / "shared.db")
+    with use_tool_context(ToolContext(engine=create_db_engine(path))):
+        init_database()
+        stock = int(get_stock_level("A4 paper", "2025-08-01")["current_stock"].iloc[0])
+    quantity = stock // 3 + 1
+
+    def worker(_):
+        with use_tool_context(ToolContext(engine=create_db_engine(path))):
+            order = process_order([OrderItem(item_name="A4 paper", quantity=quantity, price=10.0)], "2025-08-01", "2025-08-01")
+            return order.order_results[0].status
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        statuses = list(executor.map(worker, range(6)))
+
+    assert statuses.count("Processed") == stock // quantity
+    with use_tool_context(ToolContext(engine=create_db_engine(path))):
+        assert int(get_stock_level("A4 paper", "2025-08-01")["current_stock"].iloc[0]) == stock - quantity * (stock // quantity)
+
+def test_concurrent_readers_and_writer(tmp_path):
+    """Test that readers on one database never fail or read a wrong balance while checkpoints are rebuilt."""
+    path = str(tmp_path / "shared.db")
+    with use_tool_context(ToolContext(engine=create_db_engine(path))):
+        init_database()
+        cash = get_cash_balance("2025-12-31")
+        stock = int(get_stock_level("A4 paper", "2025-12-31")["current_stock"].iloc[0])
+
+    def writer():
+        # Each write is backdated, so it drops the checkpoints the readers need, and nets to zero
+        with use_tool_context(ToolContext(engine=create_db_engine(path))):
+            for day in range(1, 21):
+                create_transactions([
+                    {"item_name": "A4 paper", "transaction_type": "stock_orders", "quantity": 10, "price": 1.0, "date": f"2025-01-{day:02d}"},
+                    {"item_name": "A4 paper", "transaction_type": "sales", "quantity": 10, "price": 1.0, "date": f"2025-01-{day:02d}"},
+                ])
+
+    def reader():
+        with use_tool_context(ToolContext(engine=create_db_engine(path))):
+            return [
+                (get_cash_balance("2025-12-31"), int(get_stock_level("A4 paper", "2025-12-31")["current_stock"].iloc[0]))
+                for _ in range(20)
+            ]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        write = executor.submit(writer)
+        reads = [executor.submit(reader) for _ in range(3)]
+        write.result()
+        results = [result for read in reads for result in read.result()]
+
+    assert all(result == (pytest.approx(cash), stock) for result in results)
+
+def test_availability_timeline():
+    """Test that booked stock orders and sales show up in the projected availability."""
+    init_database()
+    on_hand = int(get_stock_level("A4 paper", "2025-08-01")["current_stock"].iloc[0])
+    create_transaction("A4 paper", "stock_orders", 500, 5.0, "2025-08-05")
+    create_transaction("A4 paper", "sales", 200, 5.0, "2025-08-08")
+
+    timeline = availability_timeline("a4 papers", "2025-08-01", "2025-08-10")
+    assert timeline.on_hand == on_hand and len(timeline.days) == 10
+    for day in timeline.days:
+        assert day.projected_stock == int(get_stock_level("A4 paper", day.date)["current_stock"].iloc[0])
+    # Stock promised before the 8th must leave enough for the sale booked that day
+    assert timeline.days[4].available_to_promise == on_hand + 300
+    assert timeline.earliest_date(on_hand + 1) == "2025-08-05"
+    assert timeline.earliest_date(on_hand + 301) is None
+    assert availability_timelines(["A4 paper", "a4 paper", "Cardstock"], "2025-08-01", "2025-08-10")[0] == timeline
+
+    # An order the booked stock order covers by the due date is sold on arrival without a restock
+    order = process_order([OrderItem(item_name="A4 paper", quantity=on_hand + 100, price=10.0)], "2025-08-01", "2025-08-09")
+    assert order.order_results[0].status == "Processed" and order.restock_results == []
+    assert int(get_stock_level("A4 paper", "2025-08-05")["current_stock"].iloc[0]) == 400
+
+def test_backorders_filled_on_arrival():
+    """Test that unfilled lines are backordered and sold when a stock order arrives by their due date."""
+    init_database()
+    on_hand = int(get_stock_level("A4 paper", "2025-08-01")["current_stock"].iloc[0])
+
+    # The restock this order triggers arrives before the due date and fills the line
+    order = process_order([OrderItem(item_name="A4 paper", quantity=on_hand + 50, price=10.0)], "2025-08-01", "2025-08-20")
+    line, restock = order.order_results[0], order.restock_results[0]
+    assert line.status == "Processed" and line.backorder_id is not None
+    assert order.total_sales_amount == 10.0 and order.all_items_processed
+    sale = pd.read_sql("SELECT * FROM transactions WHERE id = :id", db_engine, params={"id": line.transaction_id})
+    assert sale["transaction_type"].iloc[0] == "sales" and sale["units"].iloc[0] == on_hand + 50
+    assert sale["transaction_date"].iloc[0] == restock.delivery_date
+
+    # This one is due before its restock arrives, so it waits for a stock order dated in time
+    order = process_order([OrderItem(item_name="Cardstock", quantity=5000, price=20.0)], "2025-08-01", "2025-08-03")
+    line = order.order_results[0]
+    assert line.status == "Backordered" and line.transaction_id is None and not order.all_items_processed
+    create_transaction("Cardstock", "stock_orders", 6000, 100.0, "2025-08-02")
+    backorder = pd.read_sql("SELECT * FROM backorders WHERE id = :id", db_engine, params={"id": line.backorder_id})
+    assert backorder["status"].iloc[0] == "filled"
+    sale = pd.read_sql("SELECT * FROM transactions WHERE id = :id", db_engine, params={"id": int(backorder["transaction_id"].iloc[0])})
+    assert sale["units"].iloc[0] == 5000 and sale["transaction_date"].iloc[0] == "2025-08-02"
+
+    # Later arrivals do not fill it twice
+    create_transaction("Cardstock", "stock_orders", 6000, 100.0, "2025-08-02")
+    assert len(pd.read_sql("SELECT * FROM transactions WHERE item_name = 'cardstock' AND units = 5000", db_engine)) == 1
+
+def test_backorders_expire_after_due_date():
+    """Test that a backorder still open after its due date is expired and never filled."""
+    init_database()
+    order = process_order([OrderItem(item_name="Cardstock", quantity=5000, price=20.0)], "2025-08-01", "2025-08-03")
+    line = order.order_results[0]
+    assert line.status == "Backordered"
 
+    # The next order after the due date expires it, so a later arrival does not sell it
+    process_order([OrderItem(item_name="A4 paper", quantity=1, price=1.0)], "2025-08-04", "2025-08-10")
+    backorder = pd.read_sql("SELECT * FROM backorders WHERE id = :id", db_engine, params={"id": line.backorder_id})
+    assert backorder["status"].iloc[0] == "expired"
+    create_transaction("Cardstock", "stock_orders", 6000, 100.0, "2025-08-02")
+    backorder = pd.read_sql("SELECT * FROM backorders WHERE id = :id", db_engine, params={"id": line.backorder_id})
+    assert backorder["status"].iloc[0] == "expired" and pd.isna(backorder["transaction_id"].iloc[0])
 
 def test_order_agent_process_order(order_agent):
     """Test the order agent's ability to process an order."""
@@ -0,0 +1,120 @@
+import re
+from sqlalchemy import event
+import repository
+from project_starter import (
+    db_engine,
+    init_database,
+    create_transaction,
+    get_stock_level,
+    get_all_inventory,
+    get_cash_balance,
+    generate_financial_report,
+    search_quote_history,
+    find_similar_quotes,
+    quote_basket,
+    suggest_discount,
+    check_inventory_status,
+    check_inventory_bulk,
+    availability_timelines,
+    get_inventory_report,
+    restock_inventory,
+    calculate_bulk_discount,
+    process_order,
+    check_order_status,
+    get_financial_status,
+    OrderItem
+)
+
+# Tables that grow with the ledger; a full SCAN of any of them is a regression
+LEDGER_TABLES = {"transactions", "stock_checkpoints", "cash_checkpoints"}
+
+# Statements whose plan is meaningful (DDL, PRAGMAs and plain INSERT ... VALUES are skipped)
+PLANNED_STATEMENT = re.compile(r"^\s*(SELECT|WITH|UPDATE|DELETE|INSERT\s+.*\bSELECT\b)", re.IGNORECASE | re.DOTALL)
+TABLE_REFERENCE = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+
+
+def run_tool_queries():
+    """Exercise every non-LLM tool and return the distinct SQL statements it executed."""
+    init_database()
+    captured = {}
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if PLANNED_STATEMENT.match(statement):
+            captured.setdefault(statement, parameters[0] if executemany else parameters)
+
+    event.listen(db_engine, "before_cursor_execute", capture)
+    try:
+        create_transaction("A4 paper", "sales", 700, 50.0, "2025-07-31")
+        transaction_id = create_transaction("Cardstock", "stock_orders", 300, 20.0, "2025-08-05")
+        get_stock_level("A4 paper", "2025-08-01")
+        get_stock_level("Cardstock", "2025-08-01")
+        get_all_inventory("2025-08-01")
+        get_cash_balance("2025-08-01")
+        generate_financial_report("2025-08-01")
+        search_quote_history(["paper"])
+        search_quote_history([], limit=3)
+        find_similar_quotes("A4 paper for a meeting", k=3, order_size="large")
+        check_inventory_status("Cardstock", 100, "2025-08-01")
+        check_inventory_bulk([("Cardstock", 100), ("A4 paper", 20)], "2025-08-01")
+        availability_timelines(["Cardstock", "A4 paper"], "2025-08-01", "2025-08-10")
+        get_inventory_report("2025-08-01")
+        restock_inventory("2025-08-01")
+        restock_inventory("2025-08-01", pending_only=True)
+        calculate_bulk_discount("A4 paper", 500)
+        quote_basket([("A4 paper", 500), ("Cardstock", 50)], "2025-08-01")
+        suggest_discount("school teacher", "small", "party")
+        process_order([OrderItem(item_name="Glossy paper", quantity=50, price=10.0)], "2025-08-01", "2025-08-10")
+        check_order_status(transaction_id, "2025-08-10")
+        get_financial_status("2025-08-01")
+    finally:
+        event.remove(db_engine, "before_cursor_execute", capture)
+    return captured
+
+
+def full_ledger_scans(conn, statement, parameters):
+    """Return the EXPLAIN QUERY PLAN lines that scan a ledger table end to end."""
+    aliases = {}
+    for table, alias in TABLE_REFERENCE.findall(statement):
+        aliases[table.lower()] = table.lower()
+        if alias and alias.upper() not in {"WHERE", "ON", "JOIN", "GROUP", "ORDER", "LIMIT", "LEFT", "INNER", "AND", "UNION"}:
+            aliases[alias.lower()] = table.lower()
+
+    plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and aliases.get(match.group(1).lower()) in LEDGER_TABLES:
+            scans.append(detail)
+    return scans
+
+
+def test_tool_queries_use_indexes():
+    """Test that no tool query falls back to a full scan of a ledger table."""
+    statements = run_tool_queries()
+    assert statements
+
+    regressions = {}
+    with db_engine.connect() as conn:
+        for statement, parameters in statements.items():
+            scans = full_ledger_scans(conn, statement, parameters)
+            if scans:
+                regressions[" ".join(statement.split())] = scans
+
+    assert not regressions, f"Queries regressed to full ledger scans: {regressions}"
+
+
+def test_tool_queries_use_named_statements():
+    """Test that every tool query is a named statement of the repository and is counted."""
+    repository.reset_statement_counts()
+    statements = run_tool_queries()
+
+    known = set(repository.STATEMENTS.values())
+    ad_hoc = [" ".join(statement.split()) for statement in statements if statement not in known]
+    assert not ad_hoc, f"Queries bypass the repository: {ad_hoc}"
+
+    counts = repository.statement_counts()
+    assert counts["ledger.insert"] >= 2
+    assert counts["inventory.version"] >= 1
+    assert counts["ledger.transaction_as_of"] == 1
+    assert counts["report.total_between"] == 2
@@ -7,11 +7,26 @@ from project_starter import (
     # generate_quote,
     calculate_bulk_discount,
     search_quote_history,
+    store_quote,
+    find_similar_quotes,
+    quote_basket,
+    fast_quote,
+    suggest_discount,
     get_available_paper_supplies,
     init_database,
     ToolCallingAgent,
-    OpenAIServerModel
+    OpenAIServerModel,
+    create_db_engine,
+    ToolContext,
+    use_tool_context,
+    get_tool_context,
+    quote_similarity_path,
+    wait_for_refits,
+    get_stock_level,
+    get_supplier_delivery_date
 )
+from quote_similarity import QuoteSimilarityIndex
+from discount_policy import MIN_QUOTES
 
 # Fixture for setting up the test environment
 @pytest.fixture(scope="module")
@@ -95,6 +110,181 @@ def test_search_quote_history():
     if len(result) > 0:
         assert isinstance(result[0], dict)
         assert 'total_amount' in result[0]
+
+
+def test_search_quote_history_ranked():
+    """Test that quote search is stemmed, ranked, supports AND/OR and sees newly stored quotes."""
+    init_database()
+    assert search_quote_history(["zeppelin"]) == []
+    store_quote(
+        "We need zeppelin-themed streamers for three weddings.",
+        42.0,
+        "Zeppelin streamers at a friendly wedding price.",
+        job_type="event planner",
+        order_size="small",
+        event_type="wedding",
+        order_date="2025-08-01",
+    )
+
+    # Stemming matches "wedding" to "weddings"; the new quote mentions both terms, so it ranks first
+    result = search_quote_history(["zeppelin", "wedding"])
+    assert len(result) == 1 and result[0]["total_amount"] == 42.0 and result[0]["event_type"] == "wedding"
+    assert search_quote_history(["zeppelin", "cardstock"]) == []
+    either = search_quote_history(["zeppelin", "cardstock"], limit=50, match_all=False)
+    assert len(either) > 1 and any(quote["total_amount"] == 42.0 for quote in either)
+    assert len(search_quote_history([], limit=3)) == 3
+
+def test_find_similar_quotes(tmp_path):
+    """Test that differently worded requests find the same quote and that the index is saved and refreshed."""
+    engine = create_db_engine(str(tmp_path / "quotes.db"))
+    with use_tool_context(ToolContext(engine=engine)):
+        init_database()
+        path = quote_similarity_path(engine)
+        assert os.path.exists(path)
+        saved_at = os.stat(path).st_mtime_ns
+
+        # A stored quote is folded into the loaded index without a refit
+        store_quote(
+            "Requesting 300 sheets of holographic vellum for a gala.",
+            77.0,
+            "Holographic vellum, 300 sheets, with a gala discount.",
+            job_type="event planner",
+            order_size="medium",
+            event_type="gala",
+        )
+        assert get_tool_context().quote_index.added == 1 and os.stat(path).st_mtime_ns == saved_at
+        result = find_similar_quotes("Could we get some holographic vellums for our galas?", k=3)
+        assert result[0]["total_amount"] == 77.0 and 0 < result[0]["similarity"] <= 1
+        assert all(a["similarity"] >= b["similarity"] for a, b in zip(result, result[1:]))
+        receptions = find_similar_quotes("holographic vellum paper", k=3, event_type="Reception")
+        assert receptions and all(quote["event_type"] == "reception" for quote in receptions)
+        assert len(find_similar_quotes("paper for a party", k=4, order_size="large")) == 4
+        assert all(quote["order_size"] == "large" for quote in find_similar_quotes("paper for a party", k=4, order_size="large"))
+
+    # A fresh context serves the older saved index and refits it in the background
+    with use_tool_context(ToolContext(engine=engine)):
+        find_similar_quotes("holographic vellum", k=1)
+        wait_for_refits()
+        assert find_similar_quotes("holographic vellum", k=1)[0]["total_amount"] == 77.0
+        index = get_tool_context().quote_index
+        assert index.added == 0 and QuoteSimilarityIndex.saved_version(path) == index.version
+
+        # Quotes written without store_quote are picked up by the next background refit too
+        with engine.begin() as conn:
+            conn.exec_driver_sql("UPDATE quotes SET total_amount = 78.0 WHERE total_amount = 77.0")
+        assert find_similar_quotes("holographic vellum", k=1)[0]["total_amount"] == 78.0
+        wait_for_refits()
+        assert get_tool_context().quote_index.version > index.version
+        saved_at = os.stat(path).st_mtime_ns
+
+    # A context started after the refit loads the saved index instead of refitting it
+    with use_tool_context(ToolContext(engine=engine)):
+        assert find_similar_quotes("holographic vellum", k=1)[0]["total_amount"] == 78.0
+        assert not get_tool_context().refits and os.stat(path).st_mtime_ns == saved_at
+
+def test_quote_basket():
+    """Test that a whole basket is priced like calculate_bulk_discount per item, in one call."""
+    init_database()
+    on_hand = int(get_stock_level("A4 paper", "2025-08-01")["current_stock"].iloc[0])
+    lines = [
+        {"item_name": "A4 papers", "quantity": 99},
+        {"item_name": "Cardstock", "quantity": 500},
+        {"item_name": "Unobtainium", "quantity": 5},
+        {"item_name": "A4 paper", "quantity": on_hand + 1000},
+        {"item_name": "Cardstock", "quantity": 0},
+    ]
+    basket = quote_basket(lines, "2025-08-01")
+
+    # Both A4 lines get the tier of the A4 total
+    assert [line.discount_percentage for line in basket.lines] == [15, 10, 0, 15, 0]
+    single = calculate_bulk_discount("A4 paper", on_hand + 1099)
+    assert basket.lines[0].total_price + basket.lines[3].total_price == pytest.approx(single.total_price)
+    single = calculate_bulk_discount("Cardstock", 500)
+    assert basket.lines[1].unit_price == single.unit_price
+    assert basket.lines[1].total_price == pytest.approx(single.total_price)
+    assert "Invalid item name" in basket.lines[2].error and basket.lines[2].total_price == 0
+    assert "Invalid quantity" in basket.lines[4].error and basket.lines[4].total_price == 0
+    assert basket.total_amount == pytest.approx(sum(line.total_price for line in basket.lines))
+    assert basket.subtotal - basket.total_discount == pytest.approx(basket.total_amount)
+
+    # The second A4 line needs a restock of what the first line leaves short
+    assert basket.lines[0].earliest_delivery_date == "2025-08-01"
+    assert basket.lines[3].earliest_delivery_date == get_supplier_delivery_date("2025-08-01", 1099)
+    assert basket.delivery_date == max(line.earliest_delivery_date for line in basket.lines if line.error is None)
+    assert f"${basket.total_amount:.2f}" in basket.explanation and "unobtainium" not in basket.explanation
+
+def test_fast_quote():
+    """Test that clear requests are quoted without an LLM and unclear ones are handed over."""
+    init_database()
+    request = ("Please send 500 sheets of colorful poster paper, 300 roll of streamers and 200 balloons. "
+               "Deliver by April 15, 2025. (Date of request: 2025-04-01)")
+    quote = fast_quote(request, event_type="parade")
+
+    assert isinstance(quote, Quote)
+    assert [(item.item_name, item.quantity) for item in quote.items] == [
+        ("poster paper", 500), ("party streamers", 300), ("balloons", 200)
+    ]
+    basket = quote_basket([("Poster paper", 500), ("Party streamers", 300), ("Balloons", 200)], "2025-04-01")
+    assert quote.total_amount == pytest.approx(basket.total_amount)
+    assert quote.delivery_date == basket.delivery_date and quote.explanation == basket.explanation
+    assert quote.similar_quotes
+
+    # An unknown item, a catalog word left out ('A4 printer paper') and no delivery date
+    assert fast_quote("I need 2,000 posters. Deliver by April 15, 2025. (Date of request: 2025-04-01)") is None
+    ambiguous = "I need 500 sheets of A4 printer paper. Deliver by April 15, 2025. (Date of request: 2025-04-01)"
+    assert fast_quote(ambiguous) is None
+    assert fast_quote(ambiguous, threshold=0.5).items[0].item_name == "standard copy paper"
+    assert fast_quote("Please send 200 balloons. (Date of request: 2025-04-01)") is None
+
+    # Reams are quoted in sheets; a unit that does not convert to catalog units is handed over
+    quote = fast_quote("Please send 10 reams of A4 paper. Deliver by April 15, 2025. (Date of request: 2025-04-01)")
+    assert [(item.item_name, item.quantity) for item in quote.items] == [("a4 paper", 5000)]
+    assert quote.items[0].discount_percentage == 15
+    assert fast_quote("Please send 5 boxes of A4 paper. Deliver by April 15, 2025. (Date of request: 2025-04-01)") is None
+    assert fast_quote("Please send 0 sheets of A4 paper. Deliver by April 15, 2025. (Date of request: 2025-04-01)") is None
+
+def test_suggest_discount(tmp_path):
+    """Test that discounts are looked up from the most specific cell with enough quotes and refitted after quotes change."""
+    engine = create_db_engine(str(tmp_path / "discounts.db"))
+    with use_tool_context(ToolContext(engine=engine)):
+        init_database()
+        policy = get_tool_context().discount_policy
+        assert all(quotes >= MIN_QUOTES for (*cell, _, quotes) in policy.rows() if cell != ["*", "*", "*"])
+
+        manager = suggest_discount("Restaurant Manager", "small", "unheard-of event")
+        assert manager.matched_on == ["job_type", "order_size"] and manager.quotes >= MIN_QUOTES
+        assert 0 <= manager.discount_percentage <= 50
+        overall = suggest_discount("", "", "")
+        assert overall.matched_on == [] and overall.quotes >= manager.quotes
+
+        # Three new quotes at 40% off list price make a cell of their own
+        for _ in range(MIN_QUOTES):
+            store_quote("Please send 1000 sheets of A4 paper.", 30.0, "A4 paper, 40% off.", "zine maker", "large", "fair")
+        wait_for_refits()
+        zine = suggest_discount("zine maker", "large", "fair")
+        assert zine.matched_on == ["job_type", "order_size", "event_type"]
+        assert (zine.discount_percentage, zine.quotes) == (40.0, MIN_QUOTES)
+
+        # Reams are priced as 500 sheets, and quotes a little above list price count as no discount
+        for total_amount in (40.0, 55.0, 55.0):
+            store_quote("Please send 2 reams of A4 paper.", total_amount, "A4 paper.", "zine maker", "small", "fair")
+        wait_for_refits()
+        zine = suggest_discount("zine maker", "small", "fair")
+        assert (zine.discount_percentage, zine.quotes) == (0.0, MIN_QUOTES)
+
+        # Quotes removed without store_quote are served stale by the read that notices them,
+        # which refits the policy in the background
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM quotes WHERE job_type = 'zine maker'")
+        assert suggest_discount("zine maker", "large", "fair").discount_percentage == 40.0
+        wait_for_refits()
+        refitted = suggest_discount("zine maker", "large", "fair")
+        assert refitted.matched_on != ["job_type", "order_size", "event_type"]
+    # A fresh context loads the stored table without refitting it
+    with use_tool_context(ToolContext(engine=engine)):
+        assert suggest_discount("zine maker", "large", "fair") == refitted
+        assert not get_tool_context().refits
+
 #
 # def test_generate_quote():
 #     """Test the generate_quote tool directly."""